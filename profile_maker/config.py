@@ -4,4 +4,5 @@ class Config:
     # LLM settings
     API_URL = "https://openrouter.ai/api/v1/chat/completions"
     MODEL = "google/gemini-2.0-flash-lite-001"
+    REQUEST_TIMEOUT_SECONDS = 120
     USERNAME = "subhanafz"
\ No newline at end of file
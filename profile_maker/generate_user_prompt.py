@@ -16,6 +16,9 @@ class UserStyleAnalyzer:
             "Authorization": f"Bearer {LLM_API_KEY}",
             "Content-Type": "application/json"
         }
+        # Reuse one keep-alive connection across all chunks
+        self.session = requests.Session()
+        self.session.headers.update(self.headers)
         self.system_context = self._load_system_context()
         self.style_prompt = ""  # progressively updated
 
@@ -65,7 +68,7 @@ class UserStyleAnalyzer:
             "messages": messages
         }
 
-        response = requests.post(Config.API_URL, headers=self.headers, json=payload)
+        response = self.session.post(Config.API_URL, json=payload, timeout=Config.REQUEST_TIMEOUT_SECONDS)
         response.raise_for_status()
 
         data = response.json()
@@ -1,32 +1,46 @@
-import requests
-from src.settings import LLM_API_KEY
 from src.config import Config
-from src.agent.agent_tools import ToolDefinitions, ToolExecutor
-from typing import Dict, List
+from src.agent.agent_tools import ToolExecutor
+from src.agent.tool_registry import ToolRegistry
+from src.agent.router import ToolRouter
+from src.llm_transport import get_llm_transport
+from src.conversation_history import Message
+from src.token_budget import MESSAGE_TOKEN_OVERHEAD, truncate_tokens
+from src.prompt_cache import ContextFile, PromptCacheStats, system_message
+from typing import Dict, List, Sequence
+import asyncio
+from src.log import fields, get_logger
+
+log = get_logger("agent")
 
 
 class AgentClient:
     """Agent that decides which tools to use and manages tool execution."""
     
     def __init__(self):
-        self.headers = {
-            "Authorization": f"Bearer {LLM_API_KEY}",
-            "Content-Type": "application/json"
-        }
+        self.transport = get_llm_transport()
         self.tool_executor = ToolExecutor()
-        self.tool_definitions = ToolDefinitions()
-        self.memory = {}  # Store information across tool calls
-
-    def _load_system_context(self, filepath: str = Config.AGENT_TOOLS_CONTEXT_FILEPATH) -> str:
-        """Load system context from file."""
-        try:
-            with open(filepath, "r", encoding="utf-8") as f:
-                return f.read()
-        except FileNotFoundError:
-            print(f"Warning: {filepath} not found. Using empty system context.")
-            return ""
+        self.router = ToolRouter.from_executor(self.tool_executor)
+        self.tools_context = ContextFile(Config.AGENT_TOOLS_CONTEXT_FILEPATH)
+        self.prompt_cache = PromptCacheStats()
+        self._system_message = (None, None)  # (tools context text, message built from it)
+    
+    def _get_system_message(self) -> Dict:
+        """Get the static agent instructions, rebuilt only when the tools context changes."""
+        text = self.tools_context.text
+        if self._system_message[0] is not text:
+            prompt_parts = [
+                "You are a helpful AI agent that uses tools to answer questions.",
+                "You decide which tools to use to help answer user queries.",
+                "",
+                text,
+                "",
+                "Call several independent tools at once when you can. Reply without "
+                "calling any tools once no more are needed.",
+            ]
+            self._system_message = (text, system_message("\n".join(prompt_parts)))
+        return self._system_message[1]
     
-    def _build_agent_prompt(self, user_message: str, history: List[Dict] = None) -> str:
+    def _build_agent_prompt(self, user_message: str, history: Sequence[Message] = None) -> str:
         """Build a prompt for the agent to decide which tools to use.
         
         Args:
@@ -34,118 +48,224 @@ class AgentClient:
             history: Conversation history
             
         Returns:
-            Formatted prompt for the agent
+            Formatted prompt for the agent. The static instructions are sent
+            separately by _get_system_message so they form a cacheable prefix.
         """
         prompt_parts = [
-            "You are an AI agent that decides which tools to use to help answer user queries.",
-            "",
-            self._load_system_context(Config.AGENT_TOOLS_CONTEXT_FILEPATH),
-            "",
             "Analyze the following user message and determine if any tools are needed:",
             f"User message: {user_message}",
         ]
         
-        # Add memory if available
-        if self.memory:
-            prompt_parts.insert(3, f"Previous tool results: {self.memory}")
-            prompt_parts.insert(4, "")
-        
         return "\n".join(prompt_parts)
     
-    def _call_llm(self, messages: List[Dict]) -> str:
-        """Call the LLM API.
+    async def _call_llm(self, messages: List[Dict]) -> Dict:
+        """Call the LLM API with the tool schemas.
         
         Args:
             messages: List of message dictionaries
             
         Returns:
-            LLM response text
+            The assistant message, with any tool calls in "tool_calls"
         """
         payload = {
             "model": Config.MODEL,
-            "messages": messages
+            "messages": messages,
+            "tools": self.tool_executor.registry.schemas,
+            "tool_choice": "auto",
+            "usage": {"include": True}
         }
         
-        response = requests.post(Config.API_URL, headers=self.headers, json=payload)
-        response.raise_for_status()
-        
-        data = response.json()
-        return data["choices"][0]["message"]["content"]
+        data = await self.transport.complete(payload)
+        self.prompt_cache.record(data.get("usage"))
+        return data["choices"][0]["message"]
     
-    async def process_request(self, user_message: str, history: List[Dict] = None) -> Dict:
+    async def process_request(self, user_message: str, history: Sequence[Message] = None) -> Dict:
         """Process a user request and execute any necessary tools.
         
+        Each iteration asks the agent for a batch of tool calls and runs them
+        concurrently. Iterations continue until the agent needs no more tools,
+        AGENT_MAX_ITERATIONS is reached or the AGENT_TIME_BUDGET_SECONDS budget
+        runs out.
+        
         Args:
             user_message: The user's message
             history: Conversation history
             
         Returns:
-            Dictionary with tool results and updated memory
+            Dictionary with tool results and the number of iterations run
         """
-        # Clear previous memory for new request
-        self.memory = {}
+        # Memory is per request so concurrent channels don't share results
+        memory = []
+        messages = [
+            self._get_system_message(),
+            {"role": "user", "content": self._build_agent_prompt(user_message, history)}
+        ]
         
-        max_iterations = 1
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + Config.AGENT_TIME_BUDGET_SECONDS
         iteration = 0
         
-        while iteration < max_iterations:
-            iteration += 1
-            
-            # Build prompt for agent
-            agent_prompt = self._build_agent_prompt(user_message, history)
-            
-            # Ask agent what to do
-            messages = [
-                {"role": "system", "content": "You are a helpful AI agent that uses tools to answer questions."},
-                {"role": "user", "content": agent_prompt}
-            ]
-            
-            agent_response = self._call_llm(messages)
-            
-            # Parse tool request
-            tool_request = self.tool_definitions.parse_tool_request(agent_response)
-            
-            # If no tool needed, we're done
-            if tool_request["tool"] == "none":
+        while iteration < Config.AGENT_MAX_ITERATIONS:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
                 break
             
-            # Execute the tool
-            tool_name = tool_request["tool"]
-            tool_args = tool_request["args"]
-            
-            result = await self.tool_executor.execute_tool(tool_name, **tool_args)
+            iteration += 1
+            timeout = min(Config.AGENT_ITERATION_TIMEOUT_SECONDS, remaining)
             
-            # Store result in memory
-            self.memory[tool_name] = {
-                "args": tool_args,
-                "result": result
-            }
+            try:
+                should_continue = await asyncio.wait_for(
+                    self._run_iteration(messages, memory),
+                    timeout=timeout
+                )
+            except asyncio.TimeoutError:
+                log.warning("Agent iteration timed out", extra=fields(iteration=iteration))
+                # Report unfinished tools instead of leaving them without a result
+                for entry in memory:
+                    entry.setdefault("result", f"Tool timed out after {timeout:.0f} seconds")
+                break
             
-            # Check if we should continue (for multi-step tasks)
-            # For now, we'll stop after one tool execution
-            break
+            if not should_continue:
+                break
         
         return {
-            "tool_results": self.memory,
+            "tool_results": memory,
             "iterations": iteration
         }
     
-    def get_memory_summary(self) -> str:
+    async def _run_iteration(self, messages: List[Dict], memory: List[Dict]) -> bool:
+        """Ask the agent for tools and execute them concurrently.
+        
+        Args:
+            messages: The agent conversation for this request, extended in place
+                with the tool calls and their results
+            memory: Tool results for this request, updated in place
+            
+        Returns:
+            True if the agent should run another iteration
+        """
+        agent_message = await self._call_llm(messages)
+        
+        tool_calls = ToolRegistry.parse_tool_calls(agent_message)
+        
+        # If no tool needed, we're done
+        if not tool_calls:
+            return False
+        
+        # Store calls first so a timeout can still be reported
+        entries = [
+            {"tool": call["tool"], "args": call.get("args", {})}
+            for call in tool_calls
+        ]
+        memory.extend(entries)
+        
+        # Bounded per request, so one request's slow tools never hold up another's
+        semaphore = asyncio.Semaphore(Config.AGENT_MAX_PARALLEL_TOOLS)
+        await asyncio.gather(*(
+            self._execute_entry(entry, semaphore, call.get("error"))
+            for entry, call in zip(entries, tool_calls)
+        ))
+        
+        messages.append({
+            "role": "assistant",
+            "content": agent_message.get("content") or "",
+            "tool_calls": agent_message["tool_calls"],
+        })
+        messages.extend(
+            {"role": "tool", "tool_call_id": call["id"], "content": entry["result"]}
+            for entry, call in zip(entries, tool_calls)
+        )
+        
+        # Let the agent decide whether the results need follow-up tools
+        return True
+    
+    @property
+    def tool_schemas(self) -> List[Dict]:
+        """Tool schemas for the "tools" field of a chat completion request."""
+        return self.tool_executor.registry.schemas
+    
+    async def run_tool_calls(
+        self,
+        assistant_message: Dict,
+        timeout: float = Config.AGENT_ITERATION_TIMEOUT_SECONDS,
+        max_tokens: int = None,
+    ) -> List[Dict]:
+        """Execute the tool calls of an assistant message concurrently.
+        
+        Used when the chat model calls tools itself instead of going through
+        process_request.
+        
+        Args:
+            assistant_message: Assistant message with "tool_calls"
+            timeout: Seconds to wait for the tools; unfinished tools report a timeout
+            max_tokens: Token budget shared by the result messages; longer
+                results are truncated. None for no limit.
+        
+        Returns:
+            Tool role messages answering each call, in order
+        """
+        tool_calls = ToolRegistry.parse_tool_calls(assistant_message)
+        entries = [
+            {"tool": call["tool"], "args": call.get("args", {})}
+            for call in tool_calls
+        ]
+        
+        semaphore = asyncio.Semaphore(Config.AGENT_MAX_PARALLEL_TOOLS)
+        try:
+            await asyncio.wait_for(
+                asyncio.gather(*(
+                    self._execute_entry(entry, semaphore, call.get("error"))
+                    for entry, call in zip(entries, tool_calls)
+                )),
+                timeout=timeout
+            )
+        except asyncio.TimeoutError:
+            log.warning("Tool calls timed out", extra=fields(tools=len(entries)))
+            for entry in entries:
+                entry.setdefault("result", f"Tool timed out after {timeout:.0f} seconds")
+        
+        results = [entry["result"] for entry in entries]
+        if max_tokens is not None and entries:
+            per_call = max(0, max_tokens // len(entries) - MESSAGE_TOKEN_OVERHEAD)
+            results = [truncate_tokens(result, per_call) for result in results]
+        
+        return [
+            {"role": "tool", "tool_call_id": call["id"], "content": result}
+            for result, call in zip(results, tool_calls)
+        ]
+    
+    async def _execute_entry(self, entry: Dict, semaphore: asyncio.Semaphore, error: str = None):
+        """Execute one tool call, respecting its request's parallel tool limit."""
+        if error:
+            # Malformed calls are answered without running anything
+            entry["result"] = error
+            return
+        async with semaphore:
+            entry["result"] = await self.tool_executor.execute_tool(entry["tool"], **entry["args"])
+    
+    def get_memory_summary(self, tool_results: List[Dict]) -> str:
         """Get a formatted summary of tool execution results.
         
+        Args:
+            tool_results: Tool results returned by process_request
+        
         Returns:
             Formatted string of tool results
         """
-        if not self.memory:
+        if not tool_results:
             return ""
         
         summary_parts = ["Tool Execution Results:"]
         
-        for tool_name, data in self.memory.items():
-            summary_parts.append(f"\n{tool_name.upper()}:")
+        for data in tool_results:
+            summary_parts.append(f"\n{data['tool'].upper()}:")
             if "args" in data:
                 summary_parts.append(f"  Arguments: {data['args']}")
             if "result" in data:
                 summary_parts.append(f"  Result: {data['result']}")
         
-        return "\n".join(summary_parts)
\ No newline at end of file
+        return "\n".join(summary_parts)
+    
+    def shutdown(self):
+        """Release resources held by the tool executor."""
+        self.tool_executor.shutdown()
\ No newline at end of file
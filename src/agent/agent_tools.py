@@ -1,9 +1,12 @@
-import requests
 from typing import Any, Dict
 from src.config import Config
 from src.agent.web_scraper import get_scraper
 from src.agent.api_clients import TfLClient, ONSClient, YahooFinanceClient
-import json
+from src.agent.tool_cache import ToolFailure, ToolResultCache
+from src.agent.tool_registry import ToolArgumentError, ToolRegistry
+from src.metrics import get_metrics
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 import asyncio
 
 
@@ -14,12 +17,20 @@ class ToolExecutor:
         self.tfl = TfLClient()
         self.ons = ONSClient()
         self.yahoo = YahooFinanceClient()
+        # Synchronous tools run here so they never block the event loop
+        self.executor = ThreadPoolExecutor(
+            max_workers=Config.TOOL_EXECUTOR_WORKERS,
+            thread_name_prefix="tool"
+        )
+        self.cache = ToolResultCache(cacheable=self._is_cacheable)
+        # Schemas and dispatch table, built once from the tool signatures
+        self.registry = ToolRegistry.from_executor(self)
     
     # ============= WEB & SEARCH TOOLS =============
     
     @staticmethod
     async def web_search(query: str) -> str:
-        """Perform a web search or fetch a specific URL using headless browser.
+        """Perform a web search, or fetch a specific URL using headless browser.
         
         Args:
             query: Search query or URL (http://... or https://...)
@@ -59,19 +70,19 @@ class ToolExecutor:
             cleaned = "".join(c for c in expression if c in allowed_chars)
             
             if not cleaned:
-                return "Invalid expression"
+                return ToolFailure("Invalid expression")
             
             result = eval(cleaned, {"__builtins__": {}}, {})
             return f"Result: {result}"
             
         except ZeroDivisionError:
-            return "Error: Division by zero"
+            return ToolFailure("Error: Division by zero")
         except Exception as e:
-            return f"Calculation failed: {str(e)}"
+            return ToolFailure(f"Calculation failed: {str(e)}")
     
     # ============= TRANSPORT (TfL) TOOLS =============
     
-    def tfl_line_status(self, line: str = None) -> str:
+    async def tfl_line_status(self, line: str = None) -> str:
         """Get Transport for London tube line status.
         
         Args:
@@ -81,9 +92,9 @@ class ToolExecutor:
         Returns:
             Line status information
         """
-        return self.tfl.get_line_status(line)
+        return await self.tfl.get_line_status(line)
     
-    def tfl_journey_plan(self, from_location: str, to_location: str) -> str:
+    async def tfl_journey_plan(self, from_location: str, to_location: str) -> str:
         """Plan a journey in London using TfL.
         
         Args:
@@ -93,11 +104,11 @@ class ToolExecutor:
         Returns:
             Journey plan with steps and duration
         """
-        return self.tfl.plan_journey(from_location, to_location)
+        return await self.tfl.plan_journey(from_location, to_location)
     
     # ============= STATISTICS (ONS) TOOLS =============
     
-    def ons_search(self, query: str) -> str:
+    async def ons_search(self, query: str) -> str:
         """Search UK Office for National Statistics datasets.
         
         Args:
@@ -106,19 +117,19 @@ class ToolExecutor:
         Returns:
             Available datasets matching the query
         """
-        return self.ons.search_datasets(query)
+        return await self.ons.search_datasets(query)
     
-    def ons_population(self) -> str:
+    async def ons_population(self) -> str:
         """Get UK population statistics.
         
         Returns:
             Population statistics information
         """
-        return self.ons.get_population_stats()
+        return await self.ons.get_population_stats()
     
     # ============= FINANCE (Yahoo Finance) TOOLS =============
     
-    def stock_price(self, symbol: str) -> str:
+    async def stock_price(self, symbol: str) -> str:
         """Get current stock price.
         
         Args:
@@ -127,9 +138,9 @@ class ToolExecutor:
         Returns:
             Current price, change, and previous close
         """
-        return self.yahoo.get_stock_price(symbol)
+        return await self.yahoo.get_stock_price(symbol)
     
-    def crypto_price(self, symbol: str) -> str:
+    async def crypto_price(self, symbol: str) -> str:
         """Get current cryptocurrency price.
         
         Args:
@@ -138,9 +149,9 @@ class ToolExecutor:
         Returns:
             Current crypto price and change
         """
-        return self.yahoo.get_crypto_price(symbol)
+        return await self.yahoo.get_crypto_price(symbol)
     
-    def search_stock(self, company_name: str) -> str:
+    async def search_stock(self, company_name: str) -> str:
         """Search for stock ticker by company name.
         
         Args:
@@ -149,7 +160,7 @@ class ToolExecutor:
         Returns:
             List of matching tickers
         """
-        return self.yahoo.search_ticker(company_name)
+        return await self.yahoo.search_ticker(company_name)
     
     # ============= TOOL EXECUTION =============
     
@@ -158,71 +169,39 @@ class ToolExecutor:
         
         Args:
             tool_name: Name of the tool to execute
-            **kwargs: Arguments to pass to the tool
+            **kwargs: Arguments to pass to the tool, validated against its signature
             
         Returns:
-            Result of the tool execution
+            Result of the tool execution, or why the call was rejected
         """
-        tools = {
-            # Web & Search
-            "web_search": self.web_search,
-            "get_weather": self.get_weather,
-            "calculate": self.calculate,
-            
-            # Transport
-            "tfl_line_status": self.tfl_line_status,
-            "tfl_journey_plan": self.tfl_journey_plan,
-            
-            # Statistics
-            "ons_search": self.ons_search,
-            "ons_population": self.ons_population,
-            
-            # Finance
-            "stock_price": self.stock_price,
-            "crypto_price": self.crypto_price,
-            "search_stock": self.search_stock,
-        }
-        
-        if tool_name not in tools:
-            return f"Unknown tool: {tool_name}"
+        try:
+            tool, args = self.registry.resolve(tool_name, kwargs)
+        except ToolArgumentError as e:
+            return ToolFailure(str(e))
         
         try:
-            tool = tools[tool_name]
-            if asyncio.iscoroutinefunction(tool):
-                return await tool(**kwargs)
-            else:
-                return tool(**kwargs)
+            with get_metrics().timer("tool_seconds", tool=tool_name):
+                return await self.cache.get_or_call(
+                    tool_name,
+                    args,
+                    partial(self._invoke, tool, args)
+                )
         except Exception as e:
-            return f"Tool execution failed: {str(e)}"
-
-
-class ToolDefinitions:
-    """Defines available tools for the agent."""
-
+            return ToolFailure(f"Tool execution failed: {str(e)}")
+    
+    async def _invoke(self, tool, kwargs: Dict[str, Any]) -> str:
+        """Run a tool, moving synchronous tools off the event loop."""
+        if asyncio.iscoroutinefunction(tool):
+            return await tool(**kwargs)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, partial(tool, **kwargs))
+    
     @staticmethod
-    def parse_tool_request(response: str) -> Dict[str, Any]:
-        """Parse the agent's tool request.
-        
-        Args:
-            response: The agent's response
-            
-        Returns:
-            Dictionary with tool name and arguments
-        """
-        try:
-            response = response.strip()
-            
-            # Handle markdown code blocks
-            if response.startswith("```"):
-                lines = response.split("\n")
-                response = "\n".join(lines[1:-1]) if len(lines) > 2 else ""
-            
-            data = json.loads(response)
-            
-            return {
-                "tool": data.get("tool", "none"),
-                "args": data.get("args", {})
-            }
-            
-        except json.JSONDecodeError:
-            return {"tool": "none", "args": {}}
\ No newline at end of file
+    def _is_cacheable(result: str) -> bool:
+        """Check that a tool succeeded; failures are returned as ToolFailure."""
+        return not isinstance(result, ToolFailure)
+    
+    def shutdown(self):
+        """Stop the worker threads used for synchronous tools."""
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
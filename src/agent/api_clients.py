@@ -1,7 +1,16 @@
-import requests
 from typing import Dict, List, Optional
 from datetime import datetime
 from urllib.parse import quote
+import asyncio
+import aiohttp
+from src.http_client import get_http_client
+from src.agent.station_index import get_station_index
+from src.agent.tool_cache import ToolFailure
+from src.log import get_logger
+
+log = get_logger("agent")
+
+REQUEST_TIMEOUT = aiohttp.ClientTimeout(total=10)
 
 
 class TfLClient:
@@ -10,7 +19,7 @@ class TfLClient:
     BASE_URL = "https://api.tfl.gov.uk"
 
     @staticmethod
-    def resolve_location(query: str) -> str | None:
+    async def resolve_location(query: str) -> str | None:
         """
         Resolve free-text location into something JourneyResults understands.
         Returns:
@@ -20,17 +29,18 @@ class TfLClient:
         """
         url = f"{TfLClient.BASE_URL}/StopPoint/Search/{query}"
 
-        r = requests.get(url, timeout=10)
-        if r.status_code != 200:
-            return None
+        async with get_http_client().session.get(url, timeout=REQUEST_TIMEOUT) as r:
+            if r.status != 200:
+                return None
+
+            data = await r.json(content_type=None)
 
-        data = r.json()
         matches = data.get("matches", [])
         if not matches:
             return None
 
         place = matches[0]
-        print(f"Resolved '{query}' to place: {place.get('name')}")
+        log.debug("Resolved %r to place %r", query, place.get("name"))
 
         # Prefer StopPoint IDs if present
         if place.get("id", "").startswith("StopPoint"):
@@ -59,7 +69,7 @@ class TfLClient:
         return "\n".join(lines)
     
     @staticmethod
-    def get_line_status(line: Optional[str] = None) -> str:
+    async def get_line_status(line: Optional[str] = None) -> str:
         """Get status of TfL lines.
         
         Args:
@@ -74,9 +84,7 @@ class TfLClient:
             else:
                 url = f"{TfLClient.BASE_URL}/Line/Mode/tube/Status"
             
-            response = requests.get(url, timeout=10)
-            response.raise_for_status()
-            data = response.json()
+            data = await get_http_client().get_json(url, timeout=REQUEST_TIMEOUT)
             
             results = []
             for item in data:
@@ -95,10 +103,10 @@ class TfLClient:
             return "\n".join(results) if results else "No status information available"
             
         except Exception as e:
-            return f"TfL status check failed: {str(e)}"
+            return ToolFailure(f"TfL status check failed: {str(e)}")
     
     @staticmethod
-    def plan_journey(from_location: str, to_location: str) -> str:
+    async def plan_journey(from_location: str, to_location: str) -> str:
         """Plan a journey between two locations.
         
         Args:
@@ -109,24 +117,33 @@ class TfLClient:
             Journey plan information
         """
         try:
-            from_id = TfLClient.resolve_location(from_location)
-            to_id   = TfLClient.resolve_location(to_location)
+            # Known stations resolve locally; only the rest need a round trip,
+            # and those run concurrently
+            index = get_station_index()
+            locations = [from_location, to_location]
+            resolved = [index.lookup(location) for location in locations]
+            missing = [i for i, location_id in enumerate(resolved) if location_id is None]
+            if missing:
+                remote = await asyncio.gather(*(TfLClient.resolve_location(locations[i]) for i in missing))
+                for i, location_id in zip(missing, remote):
+                    resolved[i] = location_id
+                    if location_id:
+                        index.remember(locations[i], location_id)
+            from_id, to_id = resolved
 
             if not from_id or not to_id:
                 raise ValueError("Could not resolve locations")
 
             url = f"{TfLClient.BASE_URL}/Journey/JourneyResults/{from_id}/to/{to_id}"
 
-            r = requests.get(url, timeout=10)
-            r.raise_for_status()
-            data = r.json()
+            data = await get_http_client().get_json(url, timeout=REQUEST_TIMEOUT)
 
             journey = data["journeys"][0]
 
             return TfLClient._format_journey(journey)
             
         except Exception as e:
-            return f"Journey planning failed: {str(e)}"
+            return ToolFailure(f"Journey planning failed: {str(e)}")
 
 
 class ONSClient:
@@ -135,7 +152,7 @@ class ONSClient:
     BASE_URL = "https://api.beta.ons.gov.uk/v1"
     
     @staticmethod
-    def search_datasets(query: str) -> str:
+    async def search_datasets(query: str) -> str:
         """Search for ONS datasets.
         
         Args:
@@ -148,9 +165,7 @@ class ONSClient:
             url = f"{ONSClient.BASE_URL}/datasets"
             params = {"q": query}
             
-            response = requests.get(url, params=params, timeout=10)
-            response.raise_for_status()
-            data = response.json()
+            data = await get_http_client().get_json(url, params=params, timeout=REQUEST_TIMEOUT)
             
             items = data.get('items', [])
             
@@ -167,10 +182,10 @@ class ONSClient:
             return "\n\n".join(results)
             
         except Exception as e:
-            return f"ONS search failed: {str(e)}"
+            return ToolFailure(f"ONS search failed: {str(e)}")
     
     @staticmethod
-    def get_population_stats() -> str:
+    async def get_population_stats() -> str:
         """Get UK population statistics.
         
         Returns:
@@ -182,14 +197,14 @@ class ONSClient:
             return "Population data available through ONS datasets. Use search_datasets('population') for specific datasets."
             
         except Exception as e:
-            return f"Failed to get population stats: {str(e)}"
+            return ToolFailure(f"Failed to get population stats: {str(e)}")
 
 
 class YahooFinanceClient:
     """Yahoo Finance API client (using unofficial API)."""
     
     @staticmethod
-    def get_stock_price(symbol: str) -> str:
+    async def get_stock_price(symbol: str) -> str:
         """Get current stock price.
         
         Args:
@@ -213,9 +228,7 @@ class YahooFinanceClient:
                 "range": "1d"
             }
             
-            response = requests.get(url, params=params, headers=HEADERS, timeout=10)
-            response.raise_for_status()
-            data = response.json()
+            data = await get_http_client().get_json(url, params=params, headers=HEADERS, timeout=REQUEST_TIMEOUT)
             
             result = data.get('chart', {}).get('result', [])
             if not result:
@@ -237,10 +250,10 @@ class YahooFinanceClient:
                 return f"{symbol}: {currency} {current_price}"
             
         except Exception as e:
-            return f"Stock price fetch failed: {str(e)}"
+            return ToolFailure(f"Stock price fetch failed: {str(e)}")
     
     @staticmethod
-    def get_crypto_price(symbol: str) -> str:
+    async def get_crypto_price(symbol: str) -> str:
         """Get current cryptocurrency price.
         
         Args:
@@ -254,13 +267,13 @@ class YahooFinanceClient:
             if '-' not in symbol:
                 symbol = f"{symbol}-USD"
             
-            return YahooFinanceClient.get_stock_price(symbol)
+            return await YahooFinanceClient.get_stock_price(symbol)
             
         except Exception as e:
-            return f"Crypto price fetch failed: {str(e)}"
+            return ToolFailure(f"Crypto price fetch failed: {str(e)}")
     
     @staticmethod
-    def search_ticker(company_name: str) -> str:
+    async def search_ticker(company_name: str) -> str:
         """Search for a stock ticker symbol by company name.
         
         Args:
@@ -273,9 +286,7 @@ class YahooFinanceClient:
             url = "https://query2.finance.yahoo.com/v1/finance/search"
             params = {"q": company_name}
             
-            response = requests.get(url, params=params, timeout=10)
-            response.raise_for_status()
-            data = response.json()
+            data = await get_http_client().get_json(url, params=params, timeout=REQUEST_TIMEOUT)
             
             quotes = data.get('quotes', [])
             
@@ -293,4 +304,4 @@ class YahooFinanceClient:
             return "\n".join(results)
             
         except Exception as e:
-            return f"Ticker search failed: {str(e)}"
\ No newline at end of file
+            return ToolFailure(f"Ticker search failed: {str(e)}")
\ No newline at end of file
@@ -0,0 +1,126 @@
+import inspect
+import math
+import re
+from collections import Counter
+from typing import Dict, List, Tuple
+from src.config import Config
+
+# Phrases that strongly suggest each tool
+TOOL_PATTERNS = {
+    "web_search": [
+        r"\bsearch\b", r"\blook ?up\b", r"\bgoogle\b", r"https?://", r"\blatest\b",
+        r"\bnews\b", r"\bwho won\b", r"\bright now\b", r"\bonline\b", r"\bfind (out|info)\b",
+    ],
+    "get_weather": [
+        r"\bweather\b", r"\btemperature\b", r"\bforecast\b", r"\brain(ing|y)?\b", r"\bsunny\b",
+        r"\bdegrees\b", r"\bumbrella\b",
+    ],
+    "calculate": [
+        r"\d\s*[-+*/^x×]\s*\d", r"\bcalculate\b", r"\bsquare root\b", r"\bpercent of\b",
+    ],
+    "tfl_line_status": [
+        r"\btube\b", r"\btfl\b", r"\bunderground\b", r"\bdelays?\b",
+        r"\b(bakerloo|central|circle|district|jubilee|metropolitan|northern|piccadilly|victoria|elizabeth)\s+line\b",
+    ],
+    "tfl_journey_plan": [
+        r"\bjourney\b", r"\bhow (do|can|should) i get (to|from)\b", r"\bdirections\b",
+        r"\bfrom\s+\w+.*\bto\s+\w+.*\b(station|street|road|airport)\b",
+    ],
+    "ons_search": [
+        r"\bons\b", r"\bstatistics\b", r"\bgdp\b", r"\bunemployment\b", r"\binflation\b", r"\bdataset\b",
+    ],
+    "ons_population": [r"\bpopulation\b", r"\bhow many people\b"],
+    "stock_price": [
+        r"\bstocks?\b", r"\bshares\b", r"\bshare price\b", r"\$[a-z]{1,5}\b", r"\bnasdaq\b", r"\bs&p\b",
+    ],
+    "crypto_price": [
+        r"\bcrypto\b", r"\bbitcoin\b", r"\bbtc\b", r"\bethereum\b", r"\beth\b", r"\bdogecoin\b", r"\bsolana\b",
+    ],
+    "search_stock": [r"\bticker\b", r"\bstock symbol\b"],
+}
+
+# Words too common to say anything about a tool
+_STOP_WORDS = {
+    "the", "and", "for", "get", "what", "with", "from", "this", "that", "are", "you", "your",
+    "args", "returns", "e.g", "leave", "name", "current", "information", "specific",
+}
+_WORD_RE = re.compile(r"[a-z0-9]+")
+
+
+def _features(text: str) -> Counter:
+    """Bag of words and word trigrams, a cheap stand-in for a text embedding.
+    
+    Trigrams let related forms match ("forecast"/"forecasting").
+    """
+    features = Counter()
+    for word in _WORD_RE.findall(text.lower()):
+        if len(word) < 3 or word in _STOP_WORDS:
+            continue
+        features[word] += 1
+        padded = f"<{word}>"
+        for i in range(len(padded) - 2):
+            features[padded[i:i + 3]] += 0.5
+    return features
+
+
+def _cosine(a: Counter, b: Counter) -> float:
+    if len(a) > len(b):
+        a, b = b, a
+    dot = sum(weight * b[key] for key, weight in a.items() if key in b)
+    if not dot:
+        return 0.0
+    norm = math.sqrt(sum(w * w for w in a.values())) * math.sqrt(sum(w * w for w in b.values()))
+    return dot / norm
+
+
+class ToolRouter:
+    """Decides locally whether a message could need any tools.
+    
+    Keyword patterns catch the obvious cases; a similarity score against
+    each tool's description catches paraphrases. Messages that match
+    neither skip the agent entirely.
+    """
+    
+    def __init__(self, descriptions: Dict[str, str], threshold: float = Config.ROUTER_SIMILARITY_THRESHOLD):
+        self.threshold = threshold
+        self.patterns = {
+            tool: re.compile("|".join(f"(?:{pattern})" for pattern in patterns), re.IGNORECASE)
+            for tool, patterns in TOOL_PATTERNS.items()
+            if tool in descriptions
+        }
+        self.vectors = {tool: _features(f"{tool} {text}") for tool, text in descriptions.items()}
+    
+    @classmethod
+    def from_executor(cls, executor) -> "ToolRouter":
+        """Build a router from the docstrings of a ToolExecutor's tools."""
+        descriptions = {}
+        for tool in TOOL_PATTERNS:
+            method = getattr(executor, tool, None)
+            if method is not None:
+                descriptions[tool] = inspect.getdoc(method) or ""
+        return cls(descriptions)
+    
+    def candidates(self, text: str) -> List[Tuple[str, float]]:
+        """Get the tools a message could need, most likely first.
+        
+        Args:
+            text: The user's message
+        
+        Returns:
+            (tool, score) pairs; keyword matches score 1.0
+        """
+        scores = {tool: 1.0 for tool, pattern in self.patterns.items() if pattern.search(text)}
+        
+        features = _features(text)
+        if features:
+            for tool, vector in self.vectors.items():
+                if tool not in scores:
+                    score = _cosine(features, vector)
+                    if score >= self.threshold:
+                        scores[tool] = score
+        
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+    
+    def needs_tools(self, text: str) -> bool:
+        """Check whether a message could need any tools."""
+        return bool(self.candidates(text))
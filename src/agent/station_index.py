@@ -0,0 +1,198 @@
+import asyncio
+import bisect
+import difflib
+import json
+import os
+import re
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+import aiohttp
+from src.config import Config
+from src.http_client import get_http_client
+from src.log import fields, get_logger
+
+log = get_logger("agent")
+
+STATION_MODES = "tube,dlr,overground,elizabeth-line,national-rail"
+STATION_TYPES = {"NaptanMetroStation", "NaptanRailStation"}
+
+# Words that only say what kind of stop a name refers to
+_SUFFIX_RE = re.compile(r"\b(underground|rail|dlr|overground|tram|station|stn)\b")
+_NON_WORD_RE = re.compile(r"[^a-z0-9]+")
+
+
+def normalize_name(name: str) -> str:
+    """Reduce a station name or query to the form it is indexed under.
+    
+    "King's Cross St. Pancras Underground Station" -> "kings cross st pancras"
+    """
+    name = name.lower().replace("&", " and ").replace("'", "")
+    name = _SUFFIX_RE.sub(" ", name)
+    return " ".join(_NON_WORD_RE.sub(" ", name).split())
+
+
+class StationIndex:
+    """Local index of tube and rail stations, from name to StopPoint.
+    
+    Loaded once from Config.TFL_STATION_INDEX_PATH, or fetched from TfL
+    when the file is missing, and refreshed in the background. Lookups
+    never wait on the network: before the index is loaded, or when a name
+    is not in it, lookup() returns None and the caller resolves remotely.
+    Remote resolutions can be remembered with remember().
+    """
+    
+    def __init__(self, path: str = Config.TFL_STATION_INDEX_PATH):
+        self.path = path
+        self.stations = {}  # Normalized name -> (StopPoint ID, lat, lon)
+        self.names = []  # Sorted normalized names, for prefix matching
+        self.resolved = OrderedDict()  # Normalized query -> remote resolution, least recently used first
+        self.refresh_task = None
+        self.closed = False
+    
+    def start(self):
+        """Load the index and keep it fresh, in the background."""
+        if self.refresh_task is None and not self.closed:
+            self.refresh_task = asyncio.create_task(self._refresh_loop())
+    
+    async def close(self):
+        """Stop the background refresh for good."""
+        self.closed = True
+        if self.refresh_task:
+            self.refresh_task.cancel()
+            await asyncio.gather(self.refresh_task, return_exceptions=True)
+            self.refresh_task = None
+    
+    def lookup(self, query: str) -> Optional[str]:
+        """Resolve a location locally.
+        
+        Tries an exact name, then a station name the query is a prefix of,
+        then the closest name by similarity. Prefixes matching several
+        stations are left to the remote search.
+        
+        Args:
+            query: Free-text station name
+        
+        Returns:
+            StopPoint ID, "lat,lon", or None if the query is not known locally
+        """
+        self.start()
+        key = normalize_name(query)
+        if not key:
+            return None
+        
+        if key in self.resolved:
+            self.resolved.move_to_end(key)
+            return self.resolved[key]
+        
+        name = self._match(key)
+        if name is None:
+            return None
+        
+        stop_id, lat, lon = self.stations[name]
+        log.debug("Resolved %r locally to %r", query, name)
+        return stop_id or f"{lat},{lon}"
+    
+    def remember(self, query: str, location: str):
+        """Cache a remote resolution of a query."""
+        key = normalize_name(query)
+        if not key:
+            return
+        self.resolved[key] = location
+        self.resolved.move_to_end(key)
+        while len(self.resolved) > Config.TFL_RESOLVE_CACHE_SIZE:
+            self.resolved.popitem(last=False)
+    
+    def _match(self, key: str) -> Optional[str]:
+        """Find the indexed station name that best matches a normalized query."""
+        if key in self.stations:
+            return key
+        
+        # Names starting with the query sort right after it
+        start = bisect.bisect_left(self.names, key)
+        prefixed = []
+        for name in self.names[start:]:
+            if not name.startswith(key):
+                break
+            prefixed.append(name)
+        if prefixed and len(key) >= Config.TFL_STATION_PREFIX_MIN_CHARS:
+            if len(prefixed) == 1:
+                return prefixed[0]
+            # "kings cross" may stand for "kings cross st pancras", but "king"
+            # could be any of several stations
+            whole_words = [name for name in prefixed if name[len(key)] == " "]
+            return whole_words[0] if len(whole_words) == 1 else None
+        
+        close = difflib.get_close_matches(key, self.names, n=1, cutoff=Config.TFL_STATION_MATCH_CUTOFF)
+        return close[0] if close else None
+    
+    def _load(self, stations: Dict[str, Tuple[str, float, float]]):
+        """Swap in a new set of stations."""
+        self.stations = stations
+        self.names = sorted(stations)
+    
+    async def _refresh_loop(self):
+        """Load the saved index, then refetch it whenever it is older than the refresh interval."""
+        try:
+            stations, saved_at = await asyncio.to_thread(self._read_file)
+            self._load(stations)
+            log.info("Loaded station index", extra=fields(stations=len(stations)))
+        except FileNotFoundError:
+            saved_at = 0
+        except (OSError, ValueError):
+            log.exception("Failed to read station index")
+            saved_at = 0
+        
+        while True:
+            age = time.time() - saved_at
+            if age < Config.TFL_STATION_INDEX_REFRESH_SECONDS:
+                await asyncio.sleep(Config.TFL_STATION_INDEX_REFRESH_SECONDS - age)
+            try:
+                stations = await self._fetch()
+                self._load(stations)
+                saved_at = time.time()
+                await asyncio.to_thread(self._write_file, stations, saved_at)
+                log.info("Refreshed station index", extra=fields(stations=len(stations)))
+            except Exception:
+                log.exception("Failed to refresh station index")
+                # Try again sooner than a full interval
+                saved_at = time.time() - Config.TFL_STATION_INDEX_REFRESH_SECONDS + Config.TFL_STATION_INDEX_RETRY_SECONDS
+    
+    @staticmethod
+    async def _fetch() -> Dict[str, Tuple[str, float, float]]:
+        """Download all tube and rail stations from TfL."""
+        url = f"https://api.tfl.gov.uk/StopPoint/Mode/{STATION_MODES}"
+        data = await get_http_client().get_json(url, timeout=aiohttp.ClientTimeout(total=60))
+        
+        stations = {}
+        for stop in data.get("stopPoints", []):
+            if stop.get("stopType") not in STATION_TYPES:
+                continue
+            name = normalize_name(stop.get("commonName", ""))
+            # Keep the first stop for names shared by several stops
+            if name and name not in stations:
+                stations[name] = (stop.get("naptanId") or stop.get("id", ""), stop.get("lat"), stop.get("lon"))
+        return stations
+    
+    def _read_file(self) -> Tuple[Dict[str, Tuple[str, float, float]], float]:
+        with open(self.path, encoding="utf-8") as f:
+            data = json.load(f)
+        return {name: tuple(station) for name, station in data["stations"].items()}, data["saved_at"]
+    
+    def _write_file(self, stations: Dict[str, Tuple[str, float, float]], saved_at: float):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"saved_at": saved_at, "stations": stations}, f)
+        os.replace(tmp_path, self.path)
+
+
+_station_index = None
+
+
+def get_station_index() -> StationIndex:
+    """Get or create the station index singleton instance."""
+    global _station_index
+    if _station_index is None:
+        _station_index = StationIndex()
+    return _station_index
@@ -0,0 +1,128 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional
+from src.config import Config
+
+
+class ToolFailure(str):
+    """A tool result describing a failure.
+
+    Tools return these instead of raising so the agent can still show the
+    message, while the cache knows not to keep it.
+    """
+
+
+class ToolResultCache:
+    """LRU cache of tool results with per-tool freshness.
+
+    Only tools listed in the TTL table are cached. Concurrent calls with the
+    same tool and arguments share a single upstream call.
+    """
+
+    def __init__(
+        self,
+        ttls: Dict[str, float] = Config.TOOL_CACHE_TTL_SECONDS,
+        max_size: int = Config.TOOL_CACHE_MAX_SIZE,
+        cacheable: Optional[Callable[[Any], bool]] = None,
+    ):
+        self.ttls = ttls
+        self.max_size = max_size
+        self.cacheable = cacheable or (lambda result: True)
+        self.entries = OrderedDict()  # key -> (expires_at, result)
+        self.in_flight = {}  # key -> Future for the call currently fetching it
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0  # Calls that waited on an identical in-flight call
+
+    @staticmethod
+    def make_key(tool_name: str, args: Dict[str, Any]) -> tuple:
+        """Build a cache key from a tool name and normalized arguments."""
+        normalized = []
+        for name, value in sorted(args.items()):
+            if isinstance(value, str):
+                value = " ".join(value.split()).casefold()
+            normalized.append((name, value))
+        return (tool_name, tuple(normalized))
+
+    async def get_or_call(
+        self,
+        tool_name: str,
+        args: Dict[str, Any],
+        call: Callable[[], Awaitable[Any]],
+    ) -> Any:
+        """Return a fresh cached result, or run the call and cache its result.
+
+        Args:
+            tool_name: Name of the tool
+            args: Arguments the tool is called with
+            call: Coroutine function that runs the tool
+
+        Returns:
+            The tool result
+        """
+        ttl = self.ttls.get(tool_name)
+        if not ttl:
+            return await call()
+
+        key = self.make_key(tool_name, args)
+
+        entry = self.entries.get(key)
+        if entry is not None:
+            expires_at, result = entry
+            if expires_at > time.monotonic():
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return result
+            del self.entries[key]
+
+        future = self.in_flight.get(key)
+        if future is not None:
+            self.coalesced += 1
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                if not future.cancelled():
+                    raise
+                # The leading call was cancelled, not us, so fetch it ourselves
+                return await call()
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self.in_flight[key] = future
+        try:
+            result = await call()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # Mark retrieved in case nobody was waiting
+            raise
+        finally:
+            del self.in_flight[key]
+
+        future.set_result(result)
+        if self.cacheable(result):
+            self._store(key, result, ttl)
+        return result
+
+    def _store(self, key: tuple, result: Any, ttl: float):
+        """Insert a result, evicting the least recently used entries."""
+        self.entries[key] = (time.monotonic() + ttl, result)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        """Drop all cached results."""
+        self.entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        """Get cache counters."""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "size": len(self.entries),
+        }
@@ -0,0 +1,169 @@
+import inspect
+import json
+import re
+from typing import Any, Callable, Dict, List, Tuple
+
+# Tools the agent may call, in the order they are offered to the model
+TOOL_NAMES = (
+    "web_search", "get_weather", "calculate",
+    "tfl_line_status", "tfl_journey_plan",
+    "ons_search", "ons_population",
+    "stock_price", "crypto_price", "search_stock",
+)
+
+# Python annotations to JSON schema types
+_JSON_TYPES = {str: "string", int: "integer", float: "number", bool: "boolean"}
+_ARG_LINE_RE = re.compile(r"^(\w+):\s*(.*)$")
+
+
+class ToolArgumentError(ValueError):
+    """A tool call named an unknown tool or had invalid arguments."""
+
+
+def _parse_docstring(doc: str) -> Tuple[str, Dict[str, str]]:
+    """Split a Google style docstring into its summary and argument descriptions."""
+    lines = doc.splitlines()
+    summary = lines[0].strip() if lines else ""
+    
+    args = {}
+    current = None
+    in_args = False
+    for line in lines[1:]:
+        stripped = line.strip()
+        if stripped == "Args:":
+            in_args = True
+            continue
+        if not in_args:
+            continue
+        if stripped.endswith(":") and not line.startswith(" "):
+            break  # Next section, e.g. Returns:
+        match = _ARG_LINE_RE.match(stripped)
+        if match and match.group(1) not in args and line.startswith("    ") and not line.startswith("      "):
+            current = match.group(1)
+            args[current] = match.group(2)
+        elif current and stripped:
+            args[current] += " " + stripped  # Continuation line
+    return summary, args
+
+
+class ToolSpec:
+    """A callable tool with its JSON schema."""
+    
+    __slots__ = ("name", "function", "description", "types", "required", "schema")
+    
+    def __init__(self, name: str, function: Callable):
+        self.name = name
+        self.function = function
+        self.description, arg_docs = _parse_docstring(inspect.getdoc(function) or "")
+        
+        self.types = {}  # Argument name -> Python type
+        self.required = []
+        properties = {}
+        for param in inspect.signature(function).parameters.values():
+            annotation = param.annotation if param.annotation in _JSON_TYPES else str
+            self.types[param.name] = annotation
+            properties[param.name] = {"type": _JSON_TYPES[annotation]}
+            if param.name in arg_docs:
+                properties[param.name]["description"] = arg_docs[param.name]
+            if param.default is inspect.Parameter.empty:
+                self.required.append(param.name)
+        
+        self.schema = {
+            "type": "function",
+            "function": {
+                "name": name,
+                "description": self.description,
+                "parameters": {
+                    "type": "object",
+                    "properties": properties,
+                    "required": self.required,
+                },
+            },
+        }
+    
+    def validate(self, args: Dict[str, Any]) -> Dict[str, Any]:
+        """Check arguments against the signature, converting simple mismatches.
+        
+        Args:
+            args: Arguments given by the model
+        
+        Returns:
+            Arguments ready to pass to the tool
+        
+        Raises:
+            ToolArgumentError: If arguments are unknown, missing or of the wrong type
+        """
+        unknown = set(args) - set(self.types)
+        if unknown:
+            raise ToolArgumentError(f"{self.name} got unexpected arguments: {', '.join(sorted(unknown))}")
+        
+        # Models send null for optional arguments they leave out
+        clean = {name: value for name, value in args.items() if value is not None}
+        missing = [name for name in self.required if name not in clean]
+        if missing:
+            raise ToolArgumentError(f"{self.name} is missing arguments: {', '.join(missing)}")
+        
+        for name, value in clean.items():
+            expected = self.types[name]
+            if isinstance(value, expected) and not (expected is not bool and isinstance(value, bool)):
+                continue
+            if expected is str and isinstance(value, (int, float)):
+                clean[name] = str(value)
+            elif expected is float and isinstance(value, int) and not isinstance(value, bool):
+                clean[name] = float(value)
+            else:
+                raise ToolArgumentError(f"{self.name} argument {name} should be {_JSON_TYPES[expected]}")
+        return clean
+
+
+class ToolRegistry:
+    """Tool schemas and dispatch table, built once from a ToolExecutor."""
+    
+    def __init__(self, specs: List[ToolSpec]):
+        self.specs = {spec.name: spec for spec in specs}
+        self.schemas = [spec.schema for spec in specs]  # Sent as the "tools" request field
+    
+    @classmethod
+    def from_executor(cls, executor, names: Tuple[str, ...] = TOOL_NAMES) -> "ToolRegistry":
+        """Build the registry from the executor's tool methods."""
+        return cls([ToolSpec(name, getattr(executor, name)) for name in names])
+    
+    def resolve(self, name: str, args: Dict[str, Any]) -> Tuple[Callable, Dict[str, Any]]:
+        """Look up a tool and validate its arguments.
+        
+        Returns:
+            The tool function and its validated arguments
+        
+        Raises:
+            ToolArgumentError: If the tool is unknown or the arguments are invalid
+        """
+        spec = self.specs.get(name)
+        if spec is None:
+            raise ToolArgumentError(f"Unknown tool: {name}")
+        return spec.function, spec.validate(args)
+    
+    @staticmethod
+    def parse_tool_calls(message: Dict) -> List[Dict[str, Any]]:
+        """Read the tool calls from an assistant message.
+        
+        Args:
+            message: The message of a chat completion choice
+        
+        Returns:
+            List of dictionaries with the call id, tool name and arguments.
+            Calls with malformed arguments get an "error" instead of "args",
+            so the model can be told what went wrong.
+        """
+        tool_calls = []
+        for call in message.get("tool_calls") or []:
+            function = call.get("function") or {}
+            entry = {"id": call.get("id", ""), "tool": function.get("name", "")}
+            try:
+                args = json.loads(function.get("arguments") or "{}")
+                if not isinstance(args, dict):
+                    raise ValueError("arguments must be an object")
+                entry["args"] = args
+            except ValueError as e:
+                entry["error"] = f"Invalid arguments: {e}"
+            tool_calls.append(entry)
+        return tool_calls
@@ -1,95 +1,245 @@
-from playwright.async_api import async_playwright
+from playwright.async_api import async_playwright, Page, Route
+from contextlib import asynccontextmanager
+from html.parser import HTMLParser
+from urllib.parse import quote
+import aiohttp
 import asyncio
-from typing import Optional
+from typing import AsyncIterator, Dict, List, Optional
+from src.config import Config
+from src.http_client import get_http_client
+from src.log import get_logger
+from src.agent.tool_cache import ToolFailure
+
+log = get_logger("scraper")
+
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+
+
+class ClassTextParser(HTMLParser):
+    """Extracts the visible text of elements with a CSS class.
+    
+    Approximates Playwright's inner_text for server-rendered pages: block
+    elements start new lines, whitespace is collapsed and scripts are skipped.
+    """
+    
+    BLOCK_TAGS = {
+        "address", "article", "aside", "blockquote", "dd", "div", "dl", "dt",
+        "footer", "form", "h1", "h2", "h3", "h4", "h5", "h6", "header", "li",
+        "main", "nav", "ol", "p", "pre", "section", "table", "td", "th", "tr", "ul",
+    }
+    VOID_TAGS = {
+        "area", "base", "br", "col", "embed", "hr", "img", "input", "link",
+        "meta", "source", "track", "wbr",
+    }
+    SKIP_TAGS = {"script", "style", "template"}
+    
+    def __init__(self, class_name: str):
+        super().__init__(convert_charrefs=True)
+        self.class_name = class_name
+        self.results = []
+        self.parts = None  # Text of the element being extracted, None outside one
+        self.depth = 0  # Open tags inside the element being extracted
+        self.skip_depth = 0  # Open script/style tags
+    
+    def handle_starttag(self, tag: str, attrs: List):
+        if tag in self.VOID_TAGS:
+            if tag == "br" and self.parts is not None:
+                self.parts.append("\n")
+            return
+        
+        if tag in self.SKIP_TAGS:
+            self.skip_depth += 1
+        
+        if self.parts is not None:
+            self.depth += 1
+            if tag in self.BLOCK_TAGS:
+                self.parts.append("\n")
+        elif self.class_name in (dict(attrs).get("class") or "").split():
+            self.parts = []
+            self.depth = 1
+    
+    def handle_endtag(self, tag: str):
+        if tag in self.VOID_TAGS:
+            return
+        
+        if tag in self.SKIP_TAGS and self.skip_depth:
+            self.skip_depth -= 1
+        
+        if self.parts is None:
+            return
+        
+        if tag in self.BLOCK_TAGS:
+            self.parts.append("\n")
+        self.depth -= 1
+        if self.depth == 0:
+            lines = (" ".join(line.split()) for line in "".join(self.parts).split("\n"))
+            self.results.append("\n".join(line for line in lines if line))
+            self.parts = None
+    
+    def handle_data(self, data: str):
+        if self.parts is not None and not self.skip_depth:
+            self.parts.append(data)
+    
+    @classmethod
+    def extract(cls, html: str, class_name: str) -> List[str]:
+        """Get the text of every element with the given class."""
+        parser = cls(class_name)
+        parser.feed(html)
+        parser.close()
+        return parser.results
 
 
 class WebScraper:
-    """Handles web scraping using headless browser."""
+    """Handles web scraping using headless browser.
+    
+    Known server-rendered endpoints (DuckDuckGo HTML search and wttr.in) are
+    fetched over plain HTTP first. The browser is only started for arbitrary
+    URLs, or when the fast path fails.
+    """
     
     def __init__(self):
         self.playwright = None
         self.browser = None
         self.context = None
+        self.idle_pages = []  # Reusable pages, already reset to a blank state
+        self.page_semaphore = asyncio.Semaphore(Config.SCRAPER_MAX_PAGES)
+        self.init_lock = asyncio.Lock()
     
     async def initialize(self):
         """Initialize the browser instance."""
-        if self.browser is None:
-            self.playwright = await async_playwright().start()
-            self.browser = await self.playwright.firefox.launch(headless=True)
-            self.context = await self.browser.new_context(
-                user_agent='Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-            )
+        async with self.init_lock:
+            if self.browser is None:
+                self.playwright = await async_playwright().start()
+                self.browser = await self.playwright.firefox.launch(headless=True)
+                self.context = await self.browser.new_context(
+                    user_agent=USER_AGENT
+                )
+                await self.context.route("**/*", self._block_resources)
+    
+    @staticmethod
+    async def _block_resources(route: Route):
+        """Abort requests for resources we never read, so pages load faster."""
+        if route.request.resource_type in Config.SCRAPER_BLOCKED_RESOURCES:
+            await route.abort()
+        else:
+            await route.continue_()
     
     async def cleanup(self):
         """Clean up browser resources."""
-        if self.context:
-            await self.context.close()
-        if self.browser:
-            await self.browser.close()
-        if self.playwright:
-            await self.playwright.stop()
+        async with self.init_lock:
+            for page in self.idle_pages:
+                await page.close()
+            self.idle_pages.clear()
+            if self.context:
+                await self.context.close()
+            if self.browser:
+                await self.browser.close()
+            if self.playwright:
+                await self.playwright.stop()
+            self.playwright = None
+            self.browser = None
+            self.context = None
+    
+    @asynccontextmanager
+    async def page(self) -> AsyncIterator[Page]:
+        """Borrow a page from the pool.
+        
+        At most SCRAPER_MAX_PAGES pages are open at once. Pages are reset and
+        returned to the pool after use, or closed if anything went wrong.
+        """
+        async with self.page_semaphore:
+            await self.initialize()
+            page = self.idle_pages.pop() if self.idle_pages else await self.context.new_page()
+            
+            reusable = False
+            try:
+                yield page
+                await page.goto("about:blank")
+                reusable = True
+            finally:
+                if reusable and len(self.idle_pages) < Config.SCRAPER_MAX_IDLE_PAGES:
+                    self.idle_pages.append(page)
+                else:
+                    await page.close()
+    
+    @staticmethod
+    async def _fetch_text(url: str, params: Optional[Dict[str, str]] = None) -> str:
+        """Fetch a page body over plain HTTP.
+        
+        Raises:
+            ValueError: If the response is anything other than 200 OK
+        """
+        timeout = aiohttp.ClientTimeout(total=Config.SCRAPER_HTTP_TIMEOUT_SECONDS)
+        headers = {"User-Agent": USER_AGENT}
+        async with get_http_client().session.get(url, params=params, headers=headers, timeout=timeout) as response:
+            if response.status != 200:
+                raise ValueError(f"HTTP {response.status} from {url}")
+            return await response.text()
+    
+    @staticmethod
+    def _format_results(results: List[str]) -> str:
+        """Number the first five search results."""
+        extracted = [f"{i}. {result}" for i, result in enumerate(results[:5], 1)]
+        return "\n".join(extracted) or "No results found"
     
     async def search_web(self, query: str) -> str:
         """Perform a web search and extract results.
         
         Args:
             query: The search query or URL
-            
+        
         Returns:
             Extracted text content from the page
         """
-        await self.initialize()
-        page = await self.context.new_page()
-
-        try:
+        if not query.startswith("http"):
+            try:
+                html = await self._fetch_text("https://html.duckduckgo.com/html/", {"q": query})
+                return self._format_results(ClassTextParser.extract(html, "result"))
+            except Exception as e:
+                log.info("HTTP search failed, falling back to browser: %r", e)
+        
+        async with self.page() as page:
             url = query if query.startswith("http") else \
                 f"https://html.duckduckgo.com/html/?q={query}"
-
+            
             await page.goto(url, timeout=15000, wait_until="domcontentloaded")
-
+            
             if "duckduckgo" in url:
                 results = await page.query_selector_all(".result")
-                extracted = []
-
-                for i, result in enumerate(results[:5], 1):
-                    title = await result.inner_text()
-                    extracted.append(f"{i}. {title}")
-
-                return "\n".join(extracted) or "No results found"
-
+                return self._format_results([await result.inner_text() for result in results[:5]])
+            
             else:
                 body = await page.inner_text("body")
                 return body[:2000]
-
-        finally:
-            if 'page' in locals():
-                await page.close()
-        
+    
     async def get_weather(self, location: str = "London") -> str:
         """Get current weather for a location.
         
         Args:
             location: The location to get weather for
-            
+        
         Returns:
             Weather information
         """
+        # Use wttr.in for weather (text-based weather service)
+        url = f"https://wttr.in/{quote(location)}?format=3"
+        
         try:
-            await self.initialize()
-            page = await self.context.new_page()
-            
-            # Use wttr.in for weather (text-based weather service)
-            url = f"https://wttr.in/{location}?format=3"
-            await page.goto(url, timeout=10000)
-            
-            body = await page.query_selector('body')
-            weather_text = await body.inner_text() if body else "Could not fetch weather"
-            
-            await page.close()
-            return weather_text.strip()
-            
+            return (await self._fetch_text(url)).strip()
+        except Exception as e:
+            log.info("HTTP weather fetch failed, falling back to browser: %r", e)
+        
+        try:
+            async with self.page() as page:
+                await page.goto(url, timeout=10000)
+                
+                body = await page.query_selector('body')
+                weather_text = await body.inner_text() if body else "Could not fetch weather"
+                
+                return weather_text.strip()
+        
         except Exception as e:
-            return f"Weather fetch failed: {str(e)}"
+            return ToolFailure(f"Weather fetch failed: {str(e)}")
 
 
 # Singleton instance
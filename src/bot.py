@@ -1,10 +1,25 @@
 import discord
 import asyncio
-from src.chatbot import ChatbotClient
+from typing import AsyncIterator, Sequence
+from src.chatbot import ChatbotClient, HistorySummarizer
 from src.agent import AgentClient
 from src.settings import BOT_API_KEY
 from src.config import Config
-from src.conversation_history import ConversationHistory
+from src.conversation_history import ConversationHistory, Message
+from src.scheduler import RequestScheduler
+from src.http_client import get_http_client
+from src.llm_transport import get_llm_transport, get_summary_transport
+from src.metrics import get_metrics
+from src.log import fields, get_logger, setup_logging
+from src.agent.web_scraper import get_scraper
+from src.agent.station_index import get_station_index
+from src.streaming_reply import StreamingReply
+from src.buffered_stream import BufferedStream
+from src.outbound_sender import OutboundSender
+
+log = get_logger("bot")
+payload_log = get_logger("payload")  # Full message texts, sampled
+
 
 class DiscordBot:
     """Main Discord bot class."""
@@ -16,10 +31,26 @@ class DiscordBot:
         self.client = discord.Client(intents=intents)
         self.llm = ChatbotClient()
         self.agent = AgentClient()
-        self.history = ConversationHistory()
+        summarizer = HistorySummarizer().summarize if Config.SUMMARY_ENABLED else None
+        self.history = ConversationHistory(summarizer=summarizer)
+        
+        # Requests are admitted as fast as the adaptive LLM concurrency limit allows
+        llm_limiter = get_llm_transport().limiter
+        self.scheduler = RequestScheduler(
+            self.process_request,
+            self.classify_request,
+            capacity=lambda: llm_limiter.capacity
+        )
+        self.sender = OutboundSender()
         
-        self.request_queue = asyncio.Queue(maxsize=Config.QUEUE_MAX_SIZE)
-        self.processing_lock = asyncio.Lock()
+        self.metrics = get_metrics()
+        self.metrics.register("llm", get_llm_transport().stats)
+        self.metrics.register("summary_llm", get_summary_transport().stats)
+        self.metrics.register("scheduler", self.scheduler.stats)
+        self.metrics.register("response_cache", self.llm.response_cache.stats)
+        self.metrics.register("chat_prompt_cache", self.llm.prompt_cache.stats)
+        self.metrics.register("agent_prompt_cache", self.agent.prompt_cache.stats)
+        self.metrics.register("tool_cache", self.agent.tool_executor.cache.stats)
         
         self._register_events()
     
@@ -30,8 +61,7 @@ class DiscordBot:
     
     async def on_ready(self):
         """Called when the bot is ready."""
-        print(f"Logged in as {self.client.user}")
-        asyncio.create_task(self.queue_worker())
+        log.info("Logged in as %s", self.client.user)
     
     async def on_message(self, message: discord.Message):
         """Handle incoming messages."""
@@ -48,43 +78,91 @@ class DiscordBot:
         # Handle special commands
         if command_content.lower() == "clear":
             self.history.clear_history(message.channel.id)
-            await message.reply("🗑️ Conversation history cleared!")
+            await self.sender.reply(message, "🗑️ Conversation history cleared!")
             return
         
-        # Add user message to history
+        if command_content.lower() == "queue":
+            await self.sender.reply(message, self._queue_report(message.channel.id))
+            return
+        
+        # Add user message to history, loading the channel from disk if needed
+        await self.history.load(message.channel.id)
         self.history.add_message(
             message.channel.id,
             message.author.name,
             command_content
         )
         
-        # Check if queue is full
-        if self.request_queue.full():
-            await message.reply("please dont spam ;-;")
-            return
-        
-        # Add request to queue
-        await self.request_queue.put((message, command_content))
-
+        # Queue the request; a burst of messages in the channel is answered once
+        self.scheduler.submit(
+            message.channel.id,
+            (message, command_content),
+            guild_id=message.guild.id if message.guild else None,
+            user_id=message.author.id
+        )
     
+    def classify_request(self, batch: list) -> str:
+        """Get the priority class of a batch; tool use is served after plain chat."""
+        if Config.AGENT_ENABLED and any(self.agent.router.needs_tools(prompt) for _, prompt in batch):
+            return "agent"
+        return "chat"
     
-    async def queue_worker(self):
-        """Process messages from the queue."""
-        while True:
-            message, user_prompt = await self.request_queue.get()
+    def _queue_report(self, channel_id: int) -> str:
+        """Describe the channel's pending messages and queue wait times per priority class."""
+        lines = [f"📊 Queue: {self.scheduler.queue_size(channel_id)} messages pending in this channel"]
+        for priority, stats in self.scheduler.stats().items():
+            lines.append(
+                f"{priority}: {stats['depth']} waiting, "
+                f"avg wait {stats['avg_wait']:.1f}s, p95 {stats['p95_wait']:.1f}s"
+            )
+        return "\n".join(lines)
+    
+    async def process_request(self, batch: list):
+        """Generate and send one reply for a batch of queued messages.
+        
+        Args:
+            batch: (message, prompt) pairs from one channel, oldest first
+        """
+        # Reply to the latest message; the history already holds all of them
+        message = batch[-1][0]
+        if len(batch) == 1:
+            user_prompt = batch[0][1]
+        else:
+            user_prompt = "\n".join(f"{msg.author.name}: {prompt}" for msg, prompt in batch)
+        
+        trace = self.metrics.start_trace(f"channel={message.channel.id}")
+        outcome = "error"
+        speculative = None
+        try:
+            # Get conversation history
+            history = self.history.get_history(message.channel.id)
+            summary = self.history.get_summary(message.channel.id)
             
-            async with self.processing_lock:
-                try:
-                    # Get conversation history
-                    history = self.history.get_history(message.channel.id)
+            # Messages the router rules out skip the agent round trip entirely
+            tools = None
+            if Config.AGENT_ENABLED and self.agent.router.needs_tools(user_prompt):
+                if Config.AGENT_UNIFIED:
+                    # The chat model calls the tools itself and answers in the
+                    # same conversation, so tool results never enter the history
+                    tools = self.agent
+                else:
+                    if Config.SPECULATIVE_CHAT:
+                        # Start the reply now; it is only used if no tool fires
+                        speculative = BufferedStream(self._response_chunks(history, summary))
                     
                     # Step 1: Agent decides and executes tools
-                    # await self.agent.process_request(user_prompt, history)
+                    with self.metrics.timer("stage_seconds", stage="agent"):
+                        agent_result = await self.agent.process_request(user_prompt, history)
                     
                     # Step 2: Add tool results to history if any tools were used
-                    """
-                    tool_summary = self.agent.get_memory_summary()
+                    tool_summary = self.agent.get_memory_summary(agent_result["tool_results"])
                     if tool_summary:
+                        if speculative is not None:
+                            # The reply has to be generated again with the tool results
+                            await speculative.cancel()
+                            speculative = None
+                            self.metrics.inc("speculative_replies_total", outcome="discarded")
+                        
                         # Add tool results as a system message for context
                         self.history.add_message(
                             message.channel.id,
@@ -92,54 +170,107 @@ class DiscordBot:
                             f"[Tool Results]\n{tool_summary}",
                             is_bot=True
                         )
-                    print(tool_summary)
-                    """
-                    
-                    # Step 3: Get updated history with tool results
-                    #updated_history = self.history.get_history(message.channel.id)
-                    
-                    # Step 4: Generate final response using main LLM
-                    response = await asyncio.to_thread(
-                        self.llm.get_response,
-                        history
-                    )
+                        payload_log.debug("Tool results: %s", tool_summary)
+                        
+                        # Step 3: Get updated history with tool results
+                        history = self.history.get_history(message.channel.id)
+                    elif speculative is not None:
+                        self.metrics.inc("speculative_replies_total", outcome="used")
+            
+            # Step 4: Generate final response using main LLM
+            if speculative is not None:
+                chunks = speculative.items()
+            else:
+                chunks = self._response_chunks(history, summary, tools)
+            streamed = None
+            with self.metrics.timer("stage_seconds", stage="response"):
+                if Config.STREAM_RESPONSES:
+                    # Replies are sent and edited while the response streams in
+                    streamed = StreamingReply(message, self.sender)
+                    async for chunk in chunks:
+                        await streamed.append(chunk)
+                    response = await streamed.finish()
+                else:
+                    response = "".join([chunk async for chunk in chunks])
 
-                    print(f"Chatbot response: {response}")
-                    
-                    # Add bot response to history
-                    self.history.add_message(
-                        message.channel.id,
-                        self.client.user.name,
-                        response,
-                        is_bot=True
-                    )
-                    
-                    print(f"history: {self.history.get_history(message.channel.id)}")
-                    
-                    # Step 5: Send response in chunks if > 2000 characters
-                    if response and response.strip():  # only send if non-empty
-                        max_len = 2000
-                        for i in range(0, len(response), max_len):
-                            chunk = response[i:i + max_len]
-                            await message.reply(chunk)
-                    else:
-                        # fallback if the LLM returned empty
-                        fallback_msg = "THE AI RETURNED AN EMPTY STRING. I WISH I KNEW WHY. 😭"
-                        await message.reply(fallback_msg)
-                        print("Warning: attempted to send empty message")
-                                    
-                    
-                except Exception as e:
-                    await message.reply("❌ Something went wrong.")
-                    print(f"Error processing message: {e}")
-                    import traceback
-                    traceback.print_exc()
-                
-                finally:
-                    await asyncio.sleep(Config.COOLDOWN_SECONDS)
-                    self.request_queue.task_done()
+            log.info(
+                "Replied",
+                extra=fields(channel=message.channel.id, messages=len(batch), chars=len(response))
+            )
+            payload_log.debug("Chatbot response: %s", response)
+            
+            # Add bot response to history
+            self.history.add_message(
+                message.channel.id,
+                self.client.user.name,
+                response,
+                is_bot=True
+            )
+            
+            # Formatted lazily on the logging thread, and only if sampled
+            payload_log.debug("History: %s", self.history.get_history(message.channel.id))
+            
+            # Step 5: Send response, split into several replies if too long
+            if streamed is not None and streamed.sent:
+                pass  # already delivered while streaming
+            elif response and response.strip():  # only send if non-empty
+                await self.sender.reply(message, response)
+            else:
+                # fallback if the LLM returned empty
+                fallback_msg = "THE AI RETURNED AN EMPTY STRING. I WISH I KNEW WHY. 😭"
+                await self.sender.reply(message, fallback_msg)
+                log.warning("LLM returned an empty response", extra=fields(channel=message.channel.id))
+            outcome = "ok"
+        
+        except Exception:
+            await self.sender.reply(message, "❌ Something went wrong.")
+            log.exception("Error processing message", extra=fields(channel=message.channel.id))
+        finally:
+            if speculative is not None:
+                await speculative.cancel()
+            self.metrics.inc("requests_total", outcome=outcome)
+            self.metrics.inc("coalesced_messages_total", len(batch) - 1)
+            self.metrics.end_trace(trace)
+    
+    async def _response_chunks(self, history: Sequence[Message], summary: str, tools: AgentClient = None) -> AsyncIterator[str]:
+        """Generate the reply, streamed or in one piece depending on Config.STREAM_RESPONSES."""
+        if Config.STREAM_RESPONSES:
+            async for chunk in self.llm.stream_response(history, summary, tools):
+                yield chunk
+        else:
+            yield await self.llm.get_response(history, summary, tools)
+    
+    async def start(self):
+        """Connect to Discord and release shared resources on disconnect."""
+        async with self.client:
+            try:
+                await self.history.start()
+                await self.metrics.start()
+                if Config.AGENT_ENABLED:
+                    # Load TfL stations before the first journey request
+                    get_station_index().start()
+                await self.client.start(BOT_API_KEY)
+            finally:
+                await self.shutdown()
+    
+    async def shutdown(self):
+        """Stop queued work and close shared connections."""
+        await self.scheduler.close()
+        await self.sender.close()
+        self.agent.shutdown()
+        await get_scraper().cleanup()
+        await get_station_index().close()
+        await self.history.close()
+        await self.metrics.close()
+        await get_http_client().close()
     
     def run(self):
         """Start the bot."""
         assert BOT_API_KEY is not None
-        self.client.run(BOT_API_KEY)
\ No newline at end of file
+        listener = setup_logging()
+        try:
+            asyncio.run(self.start())
+        except KeyboardInterrupt:
+            pass
+        finally:
+            listener.stop()
\ No newline at end of file
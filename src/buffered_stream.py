@@ -0,0 +1,57 @@
+import asyncio
+from typing import Any, AsyncIterator
+
+_END = object()
+
+
+class _Failure:
+    __slots__ = ("error",)
+    
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+class BufferedStream:
+    """Consumes an async iterator in the background, buffering items until read.
+    
+    Used to start generating a reply speculatively: the items are produced
+    right away, but only shown once the caller decides to use them. If the
+    speculation is discarded, cancel() stops the source.
+    """
+    
+    def __init__(self, source: AsyncIterator[Any]):
+        self.queue = asyncio.Queue()
+        self.task = asyncio.create_task(self._pump(source))
+    
+    async def _pump(self, source: AsyncIterator[Any]):
+        try:
+            async for item in source:
+                self.queue.put_nowait(item)
+        except Exception as e:
+            self.queue.put_nowait(_Failure(e))
+        finally:
+            # Close the source even when cancelled, so it releases its connection
+            aclose = getattr(source, "aclose", None)
+            if aclose is not None:
+                await aclose()
+            self.queue.put_nowait(_END)
+    
+    async def items(self) -> AsyncIterator[Any]:
+        """Yield the buffered items, then the rest as they arrive.
+        
+        Raises:
+            Exception: Whatever the source raised
+        """
+        while True:
+            item = await self.queue.get()
+            if item is _END:
+                return
+            if isinstance(item, _Failure):
+                raise item.error
+            yield item
+    
+    async def cancel(self):
+        """Stop the source and drop anything not yet read."""
+        if not self.task.done():
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
@@ -1 +1,2 @@
-from .chatbot_client import ChatbotClient
\ No newline at end of file
+from .chatbot_client import ChatbotClient
+from .history_summarizer import HistorySummarizer
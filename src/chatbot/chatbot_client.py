@@ -1,54 +1,165 @@
-import requests
+import hashlib
+import json
 import re
-from src.settings import LLM_API_KEY
+import time
+from typing import AsyncIterator, Optional, Sequence
 from src.config import Config
+from src.llm_transport import get_llm_transport
+from src.conversation_history import Message
+from src.token_budget import ContextBudget, count_tokens, MESSAGE_TOKEN_OVERHEAD
+from src.prompt_cache import ContextFile, PromptCacheStats, system_message
+from src.chatbot.response_cache import ResponseCache
+from src.metrics import get_metrics
+from src.log import get_logger
+
+payload_log = get_logger("payload")  # Full message texts, sampled
+
+
+class StreamCleaner:
+    """Applies ChatbotClient.clean_response incrementally to streamed text."""
+    
+    def __init__(self, prefix: str):
+        self.prefix = prefix
+        self.head = ""  # Buffered text until we know whether it starts with the prefix
+        self.state = "prefix"  # prefix -> after_prefix -> body
+        self.last_newline = False
+    
+    def feed(self, chunk: str) -> str:
+        """Clean the next chunk of streamed text.
+        
+        Args:
+            chunk: Raw text from the stream
+        
+        Returns:
+            Cleaned text ready to display (may be empty while buffering)
+        """
+        if self.state == "prefix":
+            self.head = (self.head + chunk).lstrip("\n\r")
+            if len(self.head) < len(self.prefix) and self.prefix.startswith(self.head):
+                return ""
+            chunk, self.head = self.head, ""
+            if chunk.startswith(self.prefix):
+                chunk = chunk[len(self.prefix):]
+                self.state = "after_prefix"
+            else:
+                self.state = "body"
+        
+        if self.state == "after_prefix":
+            chunk = chunk.lstrip("\n\r")
+            if not chunk:
+                return ""
+            self.state = "body"
+        
+        # Collapse newline runs, including runs split across chunks
+        if self.last_newline:
+            chunk = chunk.lstrip("\n")
+        chunk = re.sub(r'\n+', '\n', chunk)
+        if chunk:
+            self.last_newline = chunk.endswith("\n")
+        return chunk
+    
+    def finish(self) -> str:
+        """Flush any text still buffered when the stream ends."""
+        if self.state != "prefix" or not self.head:
+            return ""
+        self.state = "body"
+        chunk, self.head = self.head, ""
+        return re.sub(r'\n+', '\n', chunk)
+
 
 class ChatbotClient:
     """Client for interacting with the LLM API."""
     
+    RESPONSE_PREFIX = "ieka:"
+    
     def __init__(self):
-        self.headers = {
-            "Authorization": f"Bearer {LLM_API_KEY}",
-            "Content-Type": "application/json"
-        }
-        self.system_context = self._load_system_context()
-    
-    def _load_system_context(self, filepath: str = Config.CHATBOT_CONTEXT_FILEPATH) -> str:
-        """Load system context from file."""
-        try:
-            with open(filepath, "r", encoding="utf-8") as f:
-                return f.read()
-        except FileNotFoundError:
-            print(f"Warning: {filepath} not found. Using empty system context.")
-            return ""
+        self.transport = get_llm_transport()
+        self.system_context = ContextFile(Config.CHATBOT_CONTEXT_FILEPATH)
+        self.budget = ContextBudget(Config.MODEL)
+        self.prompt_cache = PromptCacheStats()
+        self._system_message = (None, None)  # (context text, values built from it)
+        self.response_cache = ResponseCache()
+        self._schema_tokens = (None, 0)  # (tool schemas, their token count)
+    
+    def _get_system_message(self) -> tuple:
+        """Get the system message, its token count and a hash identifying it.
+        
+        These are rebuilt only when the context changes.
+        """
+        text = self.system_context.text
+        if self._system_message[0] is not text:
+            message = system_message(text) if text else None
+            tokens = count_tokens(text) + MESSAGE_TOKEN_OVERHEAD if text else 0
+            context_key = hashlib.sha1(f"{Config.MODEL}\n{text}".encode("utf-8")).hexdigest()
+            self._system_message = (text, (message, tokens, context_key))
+        return self._system_message[1]
+    
+    @staticmethod
+    def _single_question(history: Sequence[Message]) -> bool:
+        """Check that the reply answers only the latest user message.
+        
+        A burst of messages answered together is never cached.
+        """
+        if not Config.RESPONSE_CACHE_ENABLED or not history or history[-1].role != "user":
+            return False
+        return len(history) < 2 or history[-2].role != "user"
+    
+    def _cached_response(self, history: Sequence[Message]) -> Optional[str]:
+        """Get a cached reply to the latest user message, if caching applies.
+        
+        The key is the normalized question plus the model and system prompt,
+        so repeated questions are shared across users and channels. Replies
+        that depend on the conversation are kept out by _single_question and
+        ResponseCache.is_cacheable rather than by the key.
+        """
+        if not self._single_question(history):
+            return None
+        context_key = self._get_system_message()[2]
+        return self.response_cache.get(history[-1].content, context_key)
     
-    def _build_messages(self, history: list = None) -> list:
+    def _cache_response(self, history: Sequence[Message], response: str):
+        """Remember a reply to the latest user message, if caching applies."""
+        if not self._single_question(history):
+            return
+        context_key = self._get_system_message()[2]
+        self.response_cache.put(history[-1].content, context_key, response)
+    
+    def _build_messages(self, history: Sequence[Message] = None, summary: str = "", tools=None) -> list:
         """Build the message array for the API request.
         
         Args:
-            history: List of previous messages in format [{"role": str, "author": str, "content": str}, ...]
+            history: Previous messages from ConversationHistory
+            summary: Running summary of messages older than the history
+            tools: AgentClient whose schemas and results need room in the budget
         
         Returns:
-            List of messages formatted for the API
+            List of messages formatted for the API, with the oldest history
+            dropped to fit the model's token budget
         """
         messages = []
         
-        # Add system context
-        if self.system_context:
-            messages.append({
-                "role": "system",
-                "content": self.system_context
-            })
-        
-        # Add conversation history if available
-        if history:
-            for msg in history:
-                # Format message with author name for context
-                content = f"{msg['author']}: {msg['content']}"
-                messages.append({
-                    "role": msg["role"],
-                    "content": content
-                })
+        with get_metrics().timer("history_assembly_seconds"):
+            # Add system context first so the prefix is identical on every request
+            system, reserved, _ = self._get_system_message()
+            reserved += self._tool_tokens(tools)
+            if system:
+                messages.append(system)
+            
+            # Then the summary of older messages, which changes only
+            # occasionally and stays small
+            if summary:
+                content = f"Summary of the earlier conversation:\n{summary}"
+                messages.append({"role": "system", "content": content})
+                reserved += count_tokens(content) + MESSAGE_TOKEN_OVERHEAD
+            
+            # Add conversation history if available
+            if history:
+                for msg in self.budget.fit(history, reserved):
+                    # Format message with author name for context
+                    messages.append({
+                        "role": msg.role,
+                        "content": msg.text
+                    })
         
         return messages
     
@@ -60,31 +171,208 @@ class ChatbotClient:
         s = re.sub(r'\n+', '\n', s)
         return s
     
-    def get_response(self, history: list = None) -> str:
+    def _tool_tokens(self, tools) -> int:
+        """Tokens reserved in the prompt for the tool schemas and results."""
+        if tools is None:
+            return 0
+        schemas = tools.tool_schemas
+        if self._schema_tokens[0] is not schemas:
+            self._schema_tokens = (schemas, count_tokens(json.dumps(schemas)))
+        return self._schema_tokens[1] + Config.TOOL_RESULTS_MAX_TOKENS
+    
+    @staticmethod
+    def _offer_tools(payload: dict, tools, rounds: int, deadline: float, tool_budget: int) -> bool:
+        """Offer the tools in a request, unless the tool round, time or token budget is spent.
+        
+        Returns:
+            True if the model may call tools in this request
+        """
+        if tools is None:
+            return False
+        # Once tools are in the conversation they stay declared, but the
+        # last request has to answer
+        payload["tools"] = tools.tool_schemas
+        if rounds < Config.AGENT_MAX_ITERATIONS and time.monotonic() < deadline and tool_budget > 0:
+            return True
+        payload["tool_choice"] = "none"
+        return False
+    
+    @staticmethod
+    async def _run_tools(messages: list, reply: dict, tools, deadline: float, tool_budget: int) -> int:
+        """Run a round of tool calls and add it to the request's messages.
+        
+        Results are truncated to what is left of the tool token budget.
+        
+        Returns:
+            The tool token budget left after this round
+        """
+        timeout = max(0.0, min(Config.AGENT_ITERATION_TIMEOUT_SECONDS, deadline - time.monotonic()))
+        call_tokens = count_tokens(json.dumps(reply["tool_calls"])) + count_tokens(reply["content"]) + MESSAGE_TOKEN_OVERHEAD
+        results = await tools.run_tool_calls(reply, timeout, max(0, tool_budget - call_tokens))
+        messages.append(reply)
+        messages.extend(results)
+        return tool_budget - call_tokens - sum(
+            count_tokens(result["content"]) + MESSAGE_TOKEN_OVERHEAD for result in results
+        )
+    
+    @staticmethod
+    def _merge_tool_call_deltas(calls: dict, deltas: list):
+        """Assemble streamed tool call fragments, keyed by their index."""
+        for delta in deltas:
+            call = calls.setdefault(
+                delta.get("index", 0),
+                {"id": "", "type": "function", "function": {"name": "", "arguments": ""}}
+            )
+            if delta.get("id"):
+                call["id"] = delta["id"]
+            function = delta.get("function") or {}
+            call["function"]["name"] += function.get("name") or ""
+            call["function"]["arguments"] += function.get("arguments") or ""
+    
+    async def get_response(self, history: Sequence[Message] = None, summary: str = "", tools=None) -> str:
         """Get a response from the LLM.
         
         Args:
             history: Optional conversation history
+            summary: Running summary of messages older than the history
+            tools: Optional AgentClient whose tools the model may call before
+                answering. Tool calls and results only live in this request's
+                messages.
         
         Returns:
             The LLM's response text
         
         Raises:
-            requests.HTTPError: If the API request fails
+            aiohttp.ClientError: If the API request fails after retries
+            CircuitOpenError: If the API is failing and calls are short-circuited
+        """
+        cached = self._cached_response(history)
+        if cached is not None:
+            get_metrics().inc("response_cache_served_total")
+            return cached
+        
+        messages = self._build_messages(history, summary, tools)
+        deadline = time.monotonic() + Config.AGENT_TIME_BUDGET_SECONDS
+        tool_budget = Config.TOOL_RESULTS_MAX_TOKENS
+        rounds = 0
+        
+        while True:
+            payload = {
+                "model": Config.MODEL,
+                "messages": messages,
+                "usage": {"include": True}
+            }
+            may_call_tools = self._offer_tools(payload, tools, rounds, deadline, tool_budget)
+            
+            data = await self.transport.complete(payload)
+            self.prompt_cache.record(data.get("usage"))
+            payload_log.debug("LLM choice: %s", data["choices"][0])
+            reply = data["choices"][0]["message"]
+            if not (may_call_tools and reply.get("tool_calls")):
+                break
+            
+            # Run the tools and let the model answer with their results
+            rounds += 1
+            reply = {"role": "assistant", "content": reply.get("content") or "", "tool_calls": reply["tool_calls"]}
+            tool_budget = await self._run_tools(messages, reply, tools, deadline, tool_budget)
+        
+        response = self.clean_response(reply.get("content") or "", self.RESPONSE_PREFIX)
+        if not rounds:
+            # Answers built on tool results go stale, so only plain ones are cached
+            self._cache_response(history, response)
+        return response
+    
+    async def stream_response(self, history: Sequence[Message] = None, summary: str = "", tools=None) -> AsyncIterator[str]:
+        """Stream a response from the LLM as it is generated.
+        
+        Args:
+            history: Optional conversation history
+            summary: Running summary of messages older than the history
+            tools: Optional AgentClient whose tools the model may call before
+                answering. Tool calls and results only live in this request's
+                messages. Each round's text streams until the round starts
+                calling tools.
+        
+        Yields:
+            Cleaned chunks of the response text
+        
+        Raises:
+            aiohttp.ClientError: If the API request fails after retries
+            CircuitOpenError: If the API is failing and calls are short-circuited
+            RuntimeError: If the stream reports an error
         """
-        messages = self._build_messages(history)
-        
-        payload = {
-            "model": Config.MODEL,
-            "messages": messages
-        }
-        
-        response = requests.post(Config.API_URL, headers=self.headers, json=payload)
-        response.raise_for_status()
-        
-        data = response.json()
-        print(data["choices"][0])
-        #print(data["choices"][0]["message"]["content"])
-        response = data["choices"][0]["message"]["content"]
-        print(response)
-        return self.clean_response(response, "ieka:")
\ No newline at end of file
+        cached = self._cached_response(history)
+        if cached is not None:
+            get_metrics().inc("response_cache_served_total")
+            yield cached
+            return
+        
+        messages = self._build_messages(history, summary, tools)
+        deadline = time.monotonic() + Config.AGENT_TIME_BUDGET_SECONDS
+        tool_budget = Config.TOOL_RESULTS_MAX_TOKENS
+        rounds = 0
+        
+        while True:
+            payload = {
+                "model": Config.MODEL,
+                "messages": messages,
+                "stream": True,
+                "usage": {"include": True}
+            }
+            may_call_tools = self._offer_tools(payload, tools, rounds, deadline, tool_budget)
+            
+            cleaner = StreamCleaner(self.RESPONSE_PREFIX)
+            content = []  # Raw text of this round
+            parts = []  # Cleaned text of this round
+            shown = 0  # Parts already yielded
+            tool_calls = {}
+            async for event in self.transport.stream(payload):
+                if "error" in event:
+                    raise RuntimeError(f"LLM stream error: {event['error']}")
+                
+                # Usage arrives in the last event
+                if event.get("usage"):
+                    self.prompt_cache.record(event["usage"])
+                
+                choices = event.get("choices")
+                if not choices:
+                    continue
+                
+                delta = choices[0].get("delta", {})
+                if delta.get("tool_calls"):
+                    self._merge_tool_call_deltas(tool_calls, delta["tool_calls"])
+                if delta.get("content"):
+                    content.append(delta["content"])
+                    chunk = cleaner.feed(delta["content"])
+                    if chunk:
+                        parts.append(chunk)
+                
+                # Text streams as it arrives; once tool calls start, the rest
+                # of the round is held back
+                if not tool_calls:
+                    while shown < len(parts):
+                        yield parts[shown]
+                        shown += 1
+            
+            chunk = cleaner.finish()
+            if chunk:
+                parts.append(chunk)
+            
+            if not (may_call_tools and tool_calls):
+                # This round is the answer
+                for chunk in parts[shown:]:
+                    yield chunk
+                break
+            
+            # Run the tools and stream the answer to their results; text
+            # held back after the tool calls is never shown
+            rounds += 1
+            reply = {
+                "role": "assistant",
+                "content": "".join(content),
+                "tool_calls": [tool_calls[index] for index in sorted(tool_calls)],
+            }
+            tool_budget = await self._run_tools(messages, reply, tools, deadline, tool_budget)
+        
+        if not rounds:
+            self._cache_response(history, "".join(parts))
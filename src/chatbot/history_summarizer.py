@@ -0,0 +1,56 @@
+from typing import Sequence
+from src.config import Config
+from src.conversation_history import Message
+from src.llm_transport import get_summary_transport
+
+SUMMARY_INSTRUCTIONS = (
+    "You maintain a running summary of a Discord conversation for a chatbot. "
+    "Update the summary with the new messages. Keep names, facts, preferences "
+    "and open questions that may matter later; drop greetings and small talk. "
+    "Reply with the updated summary only, in at most {max_words} words."
+)
+
+
+class HistorySummarizer:
+    """Folds messages that left the history window into a running summary."""
+    
+    def __init__(self, model: str = Config.SUMMARY_MODEL, max_tokens: int = Config.SUMMARY_MAX_TOKENS):
+        self.model = model
+        self.max_tokens = max_tokens
+        self.transport = get_summary_transport()
+    
+    async def summarize(self, summary: str, messages: Sequence[Message]) -> str:
+        """Update a channel's summary with evicted messages.
+        
+        Args:
+            summary: Current summary, empty if there is none yet
+            messages: Messages that left the window, oldest first
+        
+        Returns:
+            The updated summary
+        
+        Raises:
+            ValueError: If the model returned no summary text
+        """
+        new_messages = "\n".join(msg.text for msg in messages)
+        payload = {
+            "model": self.model,
+            "messages": [
+                {
+                    "role": "system",
+                    # Roughly three words per four tokens
+                    "content": SUMMARY_INSTRUCTIONS.format(max_words=self.max_tokens * 3 // 4)
+                },
+                {
+                    "role": "user",
+                    "content": f"Current summary:\n{summary or '(none)'}\n\nNew messages:\n{new_messages}"
+                },
+            ],
+            "max_tokens": self.max_tokens,
+        }
+        data = await self.transport.complete(payload)
+        content = data["choices"][0]["message"].get("content")
+        if not content:
+            # E.g. a content-filtered reply; keep the summary we have
+            raise ValueError("Summary response had no content")
+        return content.strip()
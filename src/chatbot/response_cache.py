@@ -0,0 +1,167 @@
+import re
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Set
+from src.config import Config
+
+# Words that tie a question to the speaker or the ongoing conversation
+_CONTEXT_WORDS_RE = re.compile(
+    r"\b(i|me|my|mine|im|ive|we|us|our|you|your|yours|youre|he|him|his|she|her|"
+    r"they|them|their|it|its|this|that|these|those|earlier|above|again|previous)\b"
+)
+_NON_WORD_RE = re.compile(r"[^\w\s]")
+
+
+class CacheEntry:
+    """A cached response and the question it answered."""
+    
+    __slots__ = ("key", "response", "expires_at", "grams")
+    
+    def __init__(self, key: tuple, response: str, expires_at: float, grams: Set[str]):
+        self.key = key
+        self.response = response
+        self.expires_at = expires_at
+        self.grams = grams
+
+
+class ResponseCache:
+    """Cache of replies to repeated, self-contained questions.
+    
+    Lookups try an exact match on the normalized question first, then the
+    most similar cached question by character trigram overlap. Entries are
+    only shared between requests built from the same context (system prompt
+    and model).
+    """
+    
+    def __init__(
+        self,
+        ttl: float = Config.RESPONSE_CACHE_TTL_SECONDS,
+        max_size: int = Config.RESPONSE_CACHE_MAX_SIZE,
+        threshold: float = Config.RESPONSE_CACHE_SIMILARITY,
+        min_words: int = Config.RESPONSE_CACHE_MIN_WORDS,
+    ):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.threshold = threshold
+        self.min_words = min_words
+        self.entries = OrderedDict()  # (context_key, question) -> CacheEntry, least recently used first
+        self.index: Dict[str, Set[tuple]] = {}  # trigram -> keys of entries containing it
+        self.hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+        self.bypassed = 0
+    
+    @staticmethod
+    def normalize(text: str) -> str:
+        """Lowercase a question and strip punctuation and extra whitespace."""
+        return " ".join(_NON_WORD_RE.sub(" ", text.casefold()).split())
+    
+    @staticmethod
+    def trigrams(text: str) -> Set[str]:
+        """Get the character trigrams of a normalized question."""
+        padded = f" {text} "
+        return {padded[i:i + 3] for i in range(len(padded) - 2)}
+    
+    def is_cacheable(self, question: str) -> bool:
+        """Check that a normalized question makes sense without its conversation.
+        
+        Short messages and anything referring to the speaker, the bot or
+        earlier turns depend on context and are never cached.
+        """
+        return len(question.split()) >= self.min_words and not _CONTEXT_WORDS_RE.search(question)
+    
+    def get(self, question: str, context_key: str) -> Optional[str]:
+        """Look up a cached response.
+        
+        Args:
+            question: The user's latest message
+            context_key: Hash of the context the response depends on
+        
+        Returns:
+            The cached response, or None on a miss or bypass
+        """
+        question = self.normalize(question)
+        if not self.is_cacheable(question):
+            self.bypassed += 1
+            return None
+        
+        now = time.monotonic()
+        key = (context_key, question)
+        entry = self.entries.get(key)
+        if entry is not None and entry.expires_at > now:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry.response
+        
+        entry = self._most_similar(question, context_key, now)
+        if entry is not None:
+            self.entries.move_to_end(entry.key)
+            self.similar_hits += 1
+            return entry.response
+        
+        self.misses += 1
+        return None
+    
+    def put(self, question: str, context_key: str, response: str):
+        """Cache a response for a question, if the question is cacheable."""
+        question = self.normalize(question)
+        if not response or not self.is_cacheable(question):
+            return
+        
+        key = (context_key, question)
+        self._remove(key)
+        entry = CacheEntry(key, response, time.monotonic() + self.ttl, self.trigrams(question))
+        self.entries[key] = entry
+        for gram in entry.grams:
+            self.index.setdefault(gram, set()).add(key)
+        
+        while len(self.entries) > self.max_size:
+            self._remove(next(iter(self.entries)))
+    
+    def _most_similar(self, question: str, context_key: str, now: float) -> Optional[CacheEntry]:
+        """Find the fresh entry whose question is most similar, above the threshold."""
+        grams = self.trigrams(question)
+        
+        # Count shared trigrams using the index instead of scanning every entry
+        shared: Dict[tuple, int] = {}
+        for gram in grams:
+            for key in self.index.get(gram, ()):
+                if key[0] == context_key:
+                    shared[key] = shared.get(key, 0) + 1
+        
+        best, best_score = None, self.threshold
+        expired = []
+        for key, count in shared.items():
+            entry = self.entries[key]
+            if entry.expires_at <= now:
+                expired.append(key)
+                continue
+            score = count / (len(grams) + len(entry.grams) - count)
+            if score >= best_score:
+                best, best_score = entry, score
+        
+        for key in expired:
+            self._remove(key)
+        return best
+    
+    def _remove(self, key: tuple):
+        """Remove an entry and its index references."""
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            return
+        for gram in entry.grams:
+            keys = self.index.get(gram)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.index[gram]
+    
+    def stats(self) -> Dict[str, int]:
+        """Get cache counters."""
+        return {
+            "hits": self.hits,
+            "similar_hits": self.similar_hits,
+            "misses": self.misses,
+            "bypassed": self.bypassed,
+            "size": len(self.entries),
+        }
@@ -2,17 +2,144 @@ class Config:
     """Bot configuration constants."""
     
     # Queue settings
-    QUEUE_MAX_SIZE = 1
-    COOLDOWN_SECONDS = 0
+    MAX_CONCURRENT_REQUESTS = 4  # Channels processed in parallel, unless following the LLM limit
+    GUILD_WEIGHTS = {}  # guild_id -> share of request slots under load, default 1
+    SCHEDULER_WAIT_SAMPLES = 500  # Recent queue waits kept per priority class
+    COALESCE_WINDOW_SECONDS = 1.0  # Quiet time before a burst of messages is answered
+    COALESCE_MAX_WAIT_SECONDS = 3.0  # Longest a message waits for its burst to end
+    COALESCE_MAX_ITEMS = 10  # Newest messages kept in a burst; older ones are dropped
     
     # History settings
     HISTORY_SIZE = 10  # Number of messages to keep in history
-    MAX_HISTORY_CHARS = 10000  # Maximum characters for history context
+    MAX_HISTORY_TOKENS = 2500  # Maximum tokens kept in a channel's history
+    HISTORY_MAX_HOT_CHANNELS = 1000  # Channels kept in memory
+    HISTORY_CHANNEL_TTL_SECONDS = 7 * 24 * 60 * 60  # Forget channels idle this long
+    HISTORY_SWEEP_INTERVAL_SECONDS = 10 * 60
+    
+    # History summary settings
+    SUMMARY_ENABLED = True  # Fold messages leaving the window into a running summary
+    SUMMARY_MODEL = "google/gemini-2.0-flash-lite-001"  # Cheap model for summaries
+    SUMMARY_MAX_TOKENS = 300  # Maximum summary length
+    SUMMARY_MAX_CONCURRENT = 2  # Summary requests in flight, separate from reply concurrency
+    SUMMARY_BATCH_SIZE = 4  # Evicted messages collected before summarizing
+    
+    # History storage settings
+    HISTORY_BACKEND = "sqlite"  # "sqlite" or "memory"
+    HISTORY_DB_PATH = "data/history.db"
+    HISTORY_FLUSH_INTERVAL_SECONDS = 1.0  # Maximum delay before writes reach disk
+    HISTORY_FLUSH_BATCH_SIZE = 100  # Flush early once this many writes are buffered
+    
+    # HTTP settings
+    HTTP_POOL_SIZE = 100  # Total pooled connections
+    HTTP_POOL_SIZE_PER_HOST = 20  # Pooled connections per host
+    HTTP_KEEPALIVE_SECONDS = 60
+    HTTP_DNS_CACHE_SECONDS = 300
+    HTTP_TIMEOUT_SECONDS = 60
+    HTTP_CONNECT_TIMEOUT_SECONDS = 10
     
     # LLM settings
     API_URL = "https://openrouter.ai/api/v1/chat/completions"
     MODEL = "google/gemini-2.0-flash-lite-001"
+    MODEL_CONTEXT_TOKENS = {  # Context window per model
+        "google/gemini-2.0-flash-lite-001": 1048576,
+    }
+    DEFAULT_CONTEXT_TOKENS = 32768  # Context window for models missing above
+    MAX_PROMPT_TOKENS = 12000  # Prompt budget, well below the window to keep requests fast
+    RESPONSE_TOKEN_RESERVE = 1024  # Room left in the window for the reply
+    TOKEN_COUNT_CACHE_SIZE = 4096  # Memoized token counts
+    STREAM_RESPONSES = True  # Stream replies into Discord as they are generated
+    
+    # LLM resilience settings
+    LLM_CONNECT_TIMEOUT_SECONDS = 5
+    LLM_READ_TIMEOUT_SECONDS = 45  # Maximum wait for response data
+    LLM_TOTAL_TIMEOUT_SECONDS = 60  # Non-streaming requests only
+    STREAM_READ_TIMEOUT_SECONDS = 30  # Maximum gap between streamed chunks
+    LLM_MAX_RETRIES = 3
+    LLM_RETRY_BASE_DELAY_SECONDS = 0.5
+    LLM_RETRY_MAX_DELAY_SECONDS = 10  # Give up instead if Retry-After asks for longer
+    LLM_BREAKER_FAILURE_THRESHOLD = 5  # Consecutive failures before failing fast
+    LLM_BREAKER_RESET_SECONDS = 30  # Time before a trial request is let through
+    LLM_HEDGE_ENABLED = False  # Send a backup request when a call exceeds p95 latency
+    LLM_HEDGE_MIN_SAMPLES = 20  # Latency samples needed before hedging
+    LLM_LATENCY_WINDOW = 200  # Recent calls used for the p95 estimate
+    LLM_FALLBACK_MODEL = None  # Model for hedged requests, None to reuse MODEL
+    LLM_CONCURRENCY_INITIAL = 4  # Starting limit on concurrent LLM requests
+    LLM_CONCURRENCY_MIN = 1
+    LLM_CONCURRENCY_MAX = 32
+    LLM_OVERLOAD_BACKOFF = 0.5  # Limit multiplier after a 429, 5xx or timeout
+    LLM_LATENCY_SPIKE_FACTOR = 2.0  # Latency over this multiple of the median is a spike
+    LLM_LATENCY_BACKOFF = 0.9  # Limit multiplier after a latency spike
+    LLM_CONCURRENCY_DECREASE_COOLDOWN_SECONDS = 2.0  # Minimum time between limit cuts
+    
+    # Agent settings
+    AGENT_ENABLED = False  # Run the tool agent before generating each reply
+    AGENT_MAX_ITERATIONS = 3  # Agent decision rounds per request
+    AGENT_TIME_BUDGET_SECONDS = 30  # Total time for all agent iterations
+    AGENT_ITERATION_TIMEOUT_SECONDS = 20  # Deadline for one agent decision + its tool calls
+    AGENT_MAX_PARALLEL_TOOLS = 4  # Tool calls run concurrently per request
+    AGENT_UNIFIED = True  # Chat model calls tools itself; False runs the separate agent first
+    TOOL_RESULTS_MAX_TOKENS = 4000  # Prompt budget for tool calls and results in a unified request
+    TOOL_EXECUTOR_WORKERS = 4  # Threads for synchronous tools
+    ROUTER_SIMILARITY_THRESHOLD = 0.2  # Description similarity that sends a message to the agent
+    SPECULATIVE_CHAT = True  # Generate the chat reply while the agent decides on tools
+    
+    # Web scraper settings
+    SCRAPER_MAX_PAGES = 3  # Browser pages open at once
+    SCRAPER_MAX_IDLE_PAGES = 2  # Pages kept open for reuse
+    SCRAPER_BLOCKED_RESOURCES = {"image", "font", "stylesheet", "media"}
+    SCRAPER_HTTP_TIMEOUT_SECONDS = 10  # Plain HTTP fetches that skip the browser
+    
+    # TfL station index settings
+    TFL_STATION_INDEX_PATH = "data/tfl_stations.json"  # Local station name -> StopPoint index
+    TFL_STATION_INDEX_REFRESH_SECONDS = 7 * 24 * 3600  # Refetch the index when older than this
+    TFL_STATION_INDEX_RETRY_SECONDS = 3600  # Wait after a failed refresh
+    TFL_STATION_MATCH_CUTOFF = 0.85  # Minimum similarity for a fuzzy station name match
+    TFL_STATION_PREFIX_MIN_CHARS = 3  # Shortest query matched as a station name prefix
+    TFL_RESOLVE_CACHE_SIZE = 256  # Remote location resolutions remembered
+    
+    # Tool cache settings
+    TOOL_CACHE_MAX_SIZE = 512  # Cached tool results kept in memory
+    TOOL_CACHE_TTL_SECONDS = {  # Tools missing here are never cached
+        "stock_price": 15,
+        "crypto_price": 15,
+        "search_stock": 24 * 60 * 60,
+        "tfl_line_status": 2 * 60,
+        "get_weather": 10 * 60,
+        "ons_search": 6 * 60 * 60,
+        "ons_population": 6 * 60 * 60,
+    }
+    
+    # Response cache settings
+    RESPONSE_CACHE_ENABLED = False  # Reuse replies to repeated self-contained questions
+    RESPONSE_CACHE_TTL_SECONDS = 60 * 60
+    RESPONSE_CACHE_MAX_SIZE = 512
+    RESPONSE_CACHE_SIMILARITY = 0.85  # Minimum trigram similarity for a fuzzy match
+    RESPONSE_CACHE_MIN_WORDS = 4  # Shorter messages are too context-dependent to cache
+    
+    # Discord settings
+    DISCORD_MESSAGE_MAX_LENGTH = 2000
+    STREAM_EDIT_INTERVAL_SECONDS = 1.0  # Minimum time between reply edits
+    DISCORD_CHANNEL_SEND_LIMIT = 5  # Sends allowed per channel in each period
+    DISCORD_CHANNEL_SEND_PERIOD_SECONDS = 5
+    DISCORD_GLOBAL_SEND_LIMIT = 50  # Sends allowed per second across all channels
+    DISCORD_SENDER_MAX_BUCKETS = 1000  # Channel rate limit buckets kept before pruning idle ones
     
     # Context file path
     CHATBOT_CONTEXT_FILEPATH = "src/context_files/subhan_context3.txt"
-    AGENT_TOOLS_CONTEXT_FILEPATH = "src/context_files/agent_tools_context.txt"
\ No newline at end of file
+    AGENT_TOOLS_CONTEXT_FILEPATH = "src/context_files/agent_tools_context.txt"
+    CONTEXT_HOT_RELOAD = True  # Reload context files when they change on disk
+    CONTEXT_RELOAD_CHECK_SECONDS = 5  # Minimum time between mtime checks
+    PROMPT_CACHE_CONTROL = True  # Mark static prompt prefixes for provider caching
+    
+    # Logging settings
+    LOG_LEVEL = "INFO"
+    LOG_LEVELS = {"ieka.payload": "DEBUG"}  # Per-category levels overriding LOG_LEVEL
+    LOG_SAMPLE_RATES = {"ieka.payload": 0.05}  # Fraction of info/debug records kept per category
+    LOG_FORMAT = "text"  # "text" or "json"
+    
+    # Metrics settings
+    METRICS_PORT = None  # Port for the Prometheus /metrics endpoint, None to disable
+    METRICS_HOST = "127.0.0.1"
+    METRICS_DUMP_INTERVAL_SECONDS = 60  # Periodic dump to METRICS_DUMP_PATH, 0 to disable
+    METRICS_DUMP_PATH = "data/metrics.prom"
+    TRACE_REQUESTS = False  # Print a per-request timeline of pipeline stages
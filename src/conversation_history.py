@@ -1,45 +1,219 @@
-from collections import deque
+import asyncio
+import time
+from collections import deque, OrderedDict
+from typing import Awaitable, Callable, Optional, Sequence, Tuple
 from src.config import Config
+from src.history_store import HistoryStore, create_history_store
+from src.token_budget import count_tokens
+from src.log import get_logger
+
+log = get_logger("history")
+
+
+class Message:
+    """A single message in a channel's history."""
+    
+    __slots__ = ("role", "author", "content", "tokens")
+    
+    def __init__(self, role: str, author: str, content: str):
+        self.role = role
+        self.author = author
+        self.content = content
+        self.tokens = count_tokens(self.text)  # Counted once per message
+    
+    @property
+    def text(self) -> str:
+        """Content prefixed with the author, as sent to the LLM."""
+        return f"{self.author}: {self.content}"
+    
+    def __repr__(self) -> str:
+        return f"Message(role={self.role!r}, author={self.author!r}, content={self.content!r})"
+
+
+class ChannelHistory:
+    """Messages for one channel with a running token total."""
+    
+    __slots__ = ("messages", "total_tokens", "snapshot", "last_active", "summary", "evicted", "summarizing")
+    
+    def __init__(self):
+        self.messages = deque()
+        self.total_tokens = 0
+        self.snapshot = ()  # Cached read-only copy, None when stale
+        self.last_active = time.time()
+        self.summary = ""  # Running summary of messages that left the window
+        self.evicted = []  # Messages that left the window but are not summarized yet
+        self.summarizing = False
 
 
 class ConversationHistory:
-    """Manages conversation history per channel."""
+    """Manages conversation history per channel.
+    
+    Limits are applied as messages are appended, so reading a channel's
+    history never has to trim or recount it. Only recently used channels are
+    kept in memory; with a persistent store, other channels are reloaded on
+    demand by load().
     
-    def __init__(self, max_size: int = Config.HISTORY_SIZE, max_chars: int = Config.MAX_HISTORY_CHARS):
+    With a summarizer, messages trimmed from the window are folded into a
+    per-channel running summary by a background task.
+    """
+    
+    def __init__(
+        self,
+        max_size: int = Config.HISTORY_SIZE,
+        max_tokens: int = Config.MAX_HISTORY_TOKENS,
+        store: HistoryStore = None,
+        max_channels: int = Config.HISTORY_MAX_HOT_CHANNELS,
+        channel_ttl: float = Config.HISTORY_CHANNEL_TTL_SECONDS,
+        summarizer: Optional[Callable[[str, Sequence[Message]], Awaitable[str]]] = None,
+    ):
         self.max_size = max_size
-        self.max_chars = max_chars
-        self.histories = {}  # channel_id -> deque of messages
+        self.max_tokens = max_tokens
+        self.store = store if store is not None else create_history_store()
+        self.max_channels = max_channels
+        self.channel_ttl = channel_ttl
+        self.summarizer = summarizer
+        self.histories = OrderedDict()  # channel_id -> ChannelHistory, least recently used first
+        self.sweep_task = None
+        self.summary_tasks = set()
+    
+    async def start(self):
+        """Start the store and the idle channel sweep."""
+        await self.store.start()
+        self.sweep_task = asyncio.create_task(self._sweep_loop())
+    
+    async def close(self):
+        """Stop the sweep and flush the store."""
+        if self.sweep_task:
+            self.sweep_task.cancel()
+            await asyncio.gather(self.sweep_task, return_exceptions=True)
+            self.sweep_task = None
+        tasks = list(self.summary_tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await self.store.close()
+    
+    async def load(self, channel_id: int):
+        """Load a channel from the store if it is not already in memory."""
+        if channel_id in self.histories or not self.store.persistent:
+            return
+        
+        rows = await self.store.load_channel(channel_id, self.max_size)
+        summary = await self.store.load_summary(channel_id) if self.summarizer else ""
+        
+        # Another message may have loaded or started the channel meanwhile
+        if channel_id in self.histories or not (rows or summary):
+            return
+        
+        history = self._get_or_create(channel_id)
+        history.summary = summary
+        for role, author, content in rows:
+            self._append(history, Message(role, author, content))
+        # Loaded messages were already trimmed once, so do not summarize them again
+        history.evicted.clear()
     
     def add_message(self, channel_id: int, author: str, content: str, is_bot: bool = False):
         """Add a message to the channel's history."""
-        if channel_id not in self.histories:
-            self.histories[channel_id] = deque(maxlen=self.max_size)
+        history = self._get_or_create(channel_id)
+        history.last_active = time.time()
         
         role = "assistant" if is_bot else "user"
-        self.histories[channel_id].append({
-            "role": role,
-            "author": author,
-            "content": content
-        })
+        self._append(history, Message(role, author, content))
+        self.store.append(channel_id, role, author, content)
+        self._maybe_summarize(channel_id, history)
     
-    def get_history(self, channel_id: int) -> list:
-        """Get formatted history for a channel, respecting character limit."""
-        if channel_id not in self.histories:
-            return []
-        
-        history = list(self.histories[channel_id])
+    def get_history(self, channel_id: int) -> Tuple[Message, ...]:
+        """Get history for a channel, respecting token limit.
         
-        # Trim history to fit within character limit
-        total_chars = sum(len(msg["content"]) for msg in history)
+        Returns a read-only tuple that is shared between calls until the
+        channel's history changes.
+        """
+        history = self.histories.get(channel_id)
+        if history is None:
+            return ()
         
-        while total_chars > self.max_chars and len(history) > 1:
-            # Remove oldest message
-            removed = history.pop(0)
-            total_chars -= len(removed["content"])
-        
-        return history
+        self.histories.move_to_end(channel_id)
+        if history.snapshot is None:
+            history.snapshot = tuple(history.messages)
+        return history.snapshot
+    
+    def get_summary(self, channel_id: int) -> str:
+        """Get the running summary of a channel's older messages, if any."""
+        history = self.histories.get(channel_id)
+        return history.summary if history is not None else ""
     
     def clear_history(self, channel_id: int):
         """Clear history for a specific channel."""
-        if channel_id in self.histories:
-            self.histories[channel_id].clear()
+        self.histories.pop(channel_id, None)
+        self.store.clear(channel_id)
+    
+    def _get_or_create(self, channel_id: int) -> ChannelHistory:
+        """Get a channel's history, evicting the least recently used channels."""
+        history = self.histories.get(channel_id)
+        if history is not None:
+            self.histories.move_to_end(channel_id)
+            return history
+        
+        history = self.histories[channel_id] = ChannelHistory()
+        while len(self.histories) > self.max_channels:
+            self.histories.popitem(last=False)
+        return history
+    
+    def _append(self, history: ChannelHistory, message: Message):
+        """Append a message and trim the channel to its limits."""
+        history.messages.append(message)
+        history.total_tokens += message.tokens
+        history.snapshot = None
+        
+        # Drop oldest messages beyond the size or token limit, always
+        # keeping the newest message
+        messages = history.messages
+        while len(messages) > 1 and (
+            len(messages) > self.max_size or history.total_tokens > self.max_tokens
+        ):
+            removed = messages.popleft()
+            history.total_tokens -= removed.tokens
+            if self.summarizer is not None:
+                history.evicted.append(removed)
+    
+    def _maybe_summarize(self, channel_id: int, history: ChannelHistory):
+        """Start summarizing evicted messages once enough have built up."""
+        if history.summarizing or len(history.evicted) < Config.SUMMARY_BATCH_SIZE:
+            return
+        history.summarizing = True
+        task = asyncio.create_task(self._summarize(channel_id, history))
+        self.summary_tasks.add(task)
+        task.add_done_callback(self.summary_tasks.discard)
+    
+    async def _summarize(self, channel_id: int, history: ChannelHistory):
+        """Fold a channel's evicted messages into its summary, off the request path."""
+        try:
+            while len(history.evicted) >= Config.SUMMARY_BATCH_SIZE:
+                batch = history.evicted[:]
+                summary = await self.summarizer(history.summary, batch)
+                
+                # The channel may have been cleared or dropped meanwhile
+                if self.histories.get(channel_id) is not history:
+                    return
+                del history.evicted[:len(batch)]
+                history.summary = summary
+                self.store.save_summary(channel_id, summary)
+        except Exception:
+            log.exception("Failed to summarize history")
+            # Retry with the next message, but do not pile up messages forever
+            del history.evicted[:-Config.SUMMARY_BATCH_SIZE * 4]
+        finally:
+            history.summarizing = False
+    
+    async def _sweep_loop(self):
+        """Periodically forget channels that have been idle past their TTL."""
+        while True:
+            await asyncio.sleep(Config.HISTORY_SWEEP_INTERVAL_SECONDS)
+            cutoff = time.time() - self.channel_ttl
+            expired = [
+                channel_id for channel_id, history in self.histories.items()
+                if history.last_active < cutoff
+            ]
+            for channel_id in expired:
+                del self.histories[channel_id]
+            await self.store.expire(cutoff)
@@ -0,0 +1,257 @@
+import asyncio
+import os
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Tuple
+from src.config import Config
+from src.log import fields, get_logger
+
+log = get_logger("history")
+
+
+class HistoryStore:
+    """Storage backend for conversation history.
+
+    The base class keeps nothing, so history only lives in memory.
+    """
+
+    persistent = False
+
+    async def start(self):
+        """Start any background work the store needs."""
+
+    async def close(self):
+        """Write out pending changes and release resources."""
+
+    def append(self, channel_id: int, role: str, author: str, content: str):
+        """Record a new message for a channel."""
+
+    def clear(self, channel_id: int):
+        """Forget all messages and the summary for a channel."""
+
+    def save_summary(self, channel_id: int, summary: str):
+        """Record the running summary of a channel's older messages."""
+
+    async def load_channel(self, channel_id: int, limit: int) -> List[Tuple[str, str, str]]:
+        """Load the newest messages for a channel, oldest first.
+
+        Returns:
+            List of (role, author, content) tuples
+        """
+        return []
+
+    async def load_summary(self, channel_id: int) -> str:
+        """Load the running summary for a channel, empty if there is none."""
+        return ""
+
+    async def expire(self, cutoff: float):
+        """Forget channels with no activity since the cutoff timestamp."""
+
+
+class SQLiteHistoryStore(HistoryStore):
+    """History store backed by SQLite in WAL mode.
+
+    Writes are buffered and flushed in batches on a dedicated thread, so the
+    event loop never waits on disk.
+    """
+
+    persistent = True
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS messages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            channel_id INTEGER NOT NULL,
+            role TEXT NOT NULL,
+            author TEXT NOT NULL,
+            content TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_messages_channel ON messages (channel_id, id);
+        CREATE TABLE IF NOT EXISTS channels (
+            channel_id INTEGER PRIMARY KEY,
+            last_active REAL NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS summaries (
+            channel_id INTEGER PRIMARY KEY,
+            summary TEXT NOT NULL
+        );
+    """
+
+    def __init__(
+        self,
+        path: str = Config.HISTORY_DB_PATH,
+        max_messages: int = Config.HISTORY_SIZE,
+        flush_interval: float = Config.HISTORY_FLUSH_INTERVAL_SECONDS,
+        flush_batch_size: int = Config.HISTORY_FLUSH_BATCH_SIZE,
+    ):
+        self.path = path
+        self.max_messages = max_messages
+        self.flush_interval = flush_interval
+        self.flush_batch_size = flush_batch_size
+        self.pending = []  # Buffered ("append" | "clear" | "summary", channel_id, ...) operations
+        self.flush_event = asyncio.Event()
+        self.flush_lock = asyncio.Lock()
+        self.flush_task = None
+        # One thread owns the connection and runs every query in order
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="history-db")
+        self.connection = None
+
+    async def start(self):
+        await self._run(self._connect)
+        self.flush_task = asyncio.create_task(self._flush_loop())
+
+    async def close(self):
+        if self.flush_task:
+            self.flush_task.cancel()
+            await asyncio.gather(self.flush_task, return_exceptions=True)
+            self.flush_task = None
+        await self.flush()
+        await self._run(self._disconnect)
+        self.executor.shutdown(wait=True)
+
+    def append(self, channel_id: int, role: str, author: str, content: str):
+        self.pending.append(("append", channel_id, role, author, content, time.time()))
+        if len(self.pending) >= self.flush_batch_size:
+            self.flush_event.set()
+
+    def clear(self, channel_id: int):
+        self.pending.append(("clear", channel_id))
+
+    def save_summary(self, channel_id: int, summary: str):
+        self.pending.append(("summary", channel_id, summary))
+
+    async def load_channel(self, channel_id: int, limit: int) -> List[Tuple[str, str, str]]:
+        # Make sure buffered writes for this channel are visible first
+        await self.flush()
+        return await self._run(self._select_channel, channel_id, limit)
+
+    async def load_summary(self, channel_id: int) -> str:
+        await self.flush()
+        return await self._run(self._select_summary, channel_id)
+
+    async def expire(self, cutoff: float):
+        await self.flush()
+        await self._run(self._delete_expired, cutoff)
+
+    async def flush(self):
+        """Write all buffered operations in one transaction."""
+        # One flush at a time, so a failed batch is put back ahead of any
+        # later operations before they can be written
+        async with self.flush_lock:
+            if not self.pending:
+                return
+            ops, self.pending = self.pending, []
+            try:
+                await self._run(self._write, ops)
+            except Exception:
+                # Keep the batch so the next flush retries it
+                self.pending[:0] = ops
+                log.exception("Failed to write conversation history", extra=fields(ops=len(ops)))
+
+    async def _flush_loop(self):
+        """Flush periodically, or early when the buffer fills up."""
+        while True:
+            try:
+                await asyncio.wait_for(self.flush_event.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self.flush_event.clear()
+            await self.flush()
+
+    async def _run(self, func, *args):
+        """Run a database function on the store's thread."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, func, *args)
+
+    # ============= DATABASE THREAD =============
+
+    def _connect(self):
+        if self.connection is not None:
+            return
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.connection = sqlite3.connect(self.path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(self.SCHEMA)
+
+    def _disconnect(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+    def _write(self, ops: List[tuple]):
+        touched = {}  # channel_id -> last activity time
+        with self.connection:
+            for op in ops:
+                if op[0] == "append":
+                    _, channel_id, role, author, content, timestamp = op
+                    self.connection.execute(
+                        "INSERT INTO messages (channel_id, role, author, content) VALUES (?, ?, ?, ?)",
+                        (channel_id, role, author, content)
+                    )
+                    touched[channel_id] = timestamp
+                elif op[0] == "summary":
+                    _, channel_id, summary = op
+                    self.connection.execute(
+                        "INSERT INTO summaries (channel_id, summary) VALUES (?, ?) "
+                        "ON CONFLICT (channel_id) DO UPDATE SET summary = excluded.summary",
+                        (channel_id, summary)
+                    )
+                else:
+                    _, channel_id = op
+                    self.connection.execute("DELETE FROM messages WHERE channel_id = ?", (channel_id,))
+                    self.connection.execute("DELETE FROM summaries WHERE channel_id = ?", (channel_id,))
+                    self.connection.execute("DELETE FROM channels WHERE channel_id = ?", (channel_id,))
+                    touched.pop(channel_id, None)
+
+            for channel_id, timestamp in touched.items():
+                self.connection.execute(
+                    "INSERT INTO channels (channel_id, last_active) VALUES (?, ?) "
+                    "ON CONFLICT (channel_id) DO UPDATE SET last_active = excluded.last_active",
+                    (channel_id, timestamp)
+                )
+                # Keep only the newest messages the window can ever show
+                self.connection.execute(
+                    "DELETE FROM messages WHERE channel_id = ? AND id NOT IN "
+                    "(SELECT id FROM messages WHERE channel_id = ? ORDER BY id DESC LIMIT ?)",
+                    (channel_id, channel_id, self.max_messages)
+                )
+
+    def _select_channel(self, channel_id: int, limit: int) -> List[Tuple[str, str, str]]:
+        rows = self.connection.execute(
+            "SELECT role, author, content FROM messages WHERE channel_id = ? ORDER BY id DESC LIMIT ?",
+            (channel_id, limit)
+        ).fetchall()
+        rows.reverse()
+        return rows
+
+    def _select_summary(self, channel_id: int) -> str:
+        row = self.connection.execute(
+            "SELECT summary FROM summaries WHERE channel_id = ?", (channel_id,)
+        ).fetchone()
+        return row[0] if row else ""
+
+    def _delete_expired(self, cutoff: float):
+        with self.connection:
+            self.connection.execute(
+                "DELETE FROM messages WHERE channel_id IN "
+                "(SELECT channel_id FROM channels WHERE last_active < ?)",
+                (cutoff,)
+            )
+            self.connection.execute(
+                "DELETE FROM summaries WHERE channel_id IN "
+                "(SELECT channel_id FROM channels WHERE last_active < ?)",
+                (cutoff,)
+            )
+            self.connection.execute("DELETE FROM channels WHERE last_active < ?", (cutoff,))
+
+
+def create_history_store() -> HistoryStore:
+    """Create the history store selected by Config.HISTORY_BACKEND."""
+    if Config.HISTORY_BACKEND == "sqlite":
+        return SQLiteHistoryStore()
+    if Config.HISTORY_BACKEND == "memory":
+        return HistoryStore()
+    raise ValueError(f"Unknown history backend: {Config.HISTORY_BACKEND}")
@@ -0,0 +1,110 @@
+import aiohttp
+import json
+from typing import Any, AsyncIterator
+from src.config import Config
+
+
+class HttpClient:
+    """Shared async HTTP transport with keep-alive connection pooling."""
+
+    def __init__(self):
+        self._session = None
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        """Get the pooled session, creating it on first use.
+
+        Must be called from inside the running event loop.
+        """
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=Config.HTTP_POOL_SIZE,
+                limit_per_host=Config.HTTP_POOL_SIZE_PER_HOST,
+                keepalive_timeout=Config.HTTP_KEEPALIVE_SECONDS,
+                ttl_dns_cache=Config.HTTP_DNS_CACHE_SECONDS
+            )
+            timeout = aiohttp.ClientTimeout(
+                total=Config.HTTP_TIMEOUT_SECONDS,
+                sock_connect=Config.HTTP_CONNECT_TIMEOUT_SECONDS
+            )
+            self._session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+        return self._session
+
+    async def get_json(self, url: str, **kwargs) -> Any:
+        """Send a GET request and decode the JSON body.
+
+        Args:
+            url: Request URL
+            **kwargs: Extra arguments for aiohttp (params, headers, timeout, ...)
+
+        Returns:
+            Decoded JSON response
+
+        Raises:
+            aiohttp.ClientResponseError: If the response status is an error
+        """
+        async with self.session.get(url, **kwargs) as response:
+            response.raise_for_status()
+            return await response.json(content_type=None)
+
+    async def post_json(self, url: str, **kwargs) -> Any:
+        """Send a POST request and decode the JSON body.
+
+        Args:
+            url: Request URL
+            **kwargs: Extra arguments for aiohttp (json, headers, timeout, ...)
+
+        Returns:
+            Decoded JSON response
+
+        Raises:
+            aiohttp.ClientResponseError: If the response status is an error
+        """
+        async with self.session.post(url, **kwargs) as response:
+            response.raise_for_status()
+            return await response.json(content_type=None)
+
+    async def stream_sse(self, url: str, **kwargs) -> AsyncIterator[Any]:
+        """Send a POST request and yield decoded server-sent events.
+
+        Each ``data:`` line is decoded as JSON. Comment lines are skipped and
+        the stream ends at ``data: [DONE]``.
+
+        Args:
+            url: Request URL
+            **kwargs: Extra arguments for aiohttp (json, headers, timeout, ...)
+
+        Yields:
+            Decoded JSON event payloads
+
+        Raises:
+            aiohttp.ClientResponseError: If the response status is an error
+        """
+        async with self.session.post(url, **kwargs) as response:
+            response.raise_for_status()
+            async for raw_line in response.content:
+                line = raw_line.decode("utf-8").strip()
+                if not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    break
+                yield json.loads(data)
+
+    async def close(self):
+        """Close the session and its pooled connections."""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+
+# Singleton instance
+_http_client_instance = None
+
+
+def get_http_client() -> HttpClient:
+    """Get or create the shared HTTP client singleton instance."""
+    global _http_client_instance
+    if _http_client_instance is None:
+        _http_client_instance = HttpClient()
+    return _http_client_instance
@@ -0,0 +1,469 @@
+import aiohttp
+import asyncio
+import random
+import time
+from collections import deque
+from email.utils import parsedate_to_datetime
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional
+from src.settings import LLM_API_KEY
+from src.config import Config
+from src.http_client import get_http_client
+from src.metrics import get_metrics
+from src.log import fields, get_logger
+
+log = get_logger("llm")
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised when the LLM API is failing and calls are being short-circuited."""
+
+
+class CircuitBreaker:
+    """Stops calling an endpoint after repeated failures.
+    
+    After ``failure_threshold`` consecutive failures the circuit opens and
+    calls fail fast for ``reset_seconds``. Then a single trial call is let
+    through; its outcome closes or re-opens the circuit.
+    """
+    
+    def __init__(
+        self,
+        failure_threshold: int = Config.LLM_BREAKER_FAILURE_THRESHOLD,
+        reset_seconds: float = Config.LLM_BREAKER_RESET_SECONDS,
+    ):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at = None  # None while closed
+        self.trial_in_flight = False
+    
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at < self.reset_seconds:
+            return "open"
+        return "half_open"
+    
+    def allow(self) -> bool:
+        """Check whether a call may be made now."""
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self.trial_in_flight:
+            self.trial_in_flight = True
+            return True
+        return False
+    
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+    
+    def record_failure(self):
+        self.failures += 1
+        if self.trial_in_flight or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+        self.trial_in_flight = False
+
+
+class LatencyWindow:
+    """Recent call latencies for percentile estimates."""
+    
+    def __init__(self, size: int = Config.LLM_LATENCY_WINDOW):
+        self.samples = deque(maxlen=size)
+    
+    def record(self, seconds: float):
+        self.samples.append(seconds)
+    
+    def percentile(self, percent: float) -> Optional[float]:
+        """Get a latency percentile, or None until enough samples exist."""
+        if len(self.samples) < Config.LLM_HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(self.samples)
+        index = min(len(ordered) - 1, int(len(ordered) * percent / 100))
+        return ordered[index]
+
+
+class AdaptiveLimiter:
+    """Limits concurrent LLM requests, adapting the limit with AIMD.
+    
+    While the limit is in full use and calls succeed at normal latency it
+    grows by about one request per round of calls. It is cut
+    multiplicatively on 429s, 5xx responses and timeouts, and more gently
+    when latency spikes well above the recent median.
+    """
+    
+    def __init__(
+        self,
+        initial: float = Config.LLM_CONCURRENCY_INITIAL,
+        min_limit: float = Config.LLM_CONCURRENCY_MIN,
+        max_limit: float = Config.LLM_CONCURRENCY_MAX,
+    ):
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.in_flight = 0
+        self.waiters = deque()
+        self.last_decrease = 0.0
+    
+    @property
+    def capacity(self) -> int:
+        """Number of requests currently allowed in flight."""
+        return max(1, int(self.limit))
+    
+    async def acquire(self):
+        """Wait until another request may be sent."""
+        if self.in_flight < self.capacity and not self.waiters:
+            self.in_flight += 1
+            return
+        
+        future = asyncio.get_running_loop().create_future()
+        self.waiters.append(future)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.cancelled():
+                try:
+                    self.waiters.remove(future)
+                except ValueError:
+                    pass
+            else:
+                # Granted a slot just as we were cancelled
+                self.release()
+            raise
+    
+    def release(self):
+        """Mark a request as finished."""
+        self.in_flight -= 1
+        self._wake()
+    
+    def _wake(self):
+        while self.waiters and self.in_flight < self.capacity:
+            future = self.waiters.popleft()
+            if not future.done():
+                self.in_flight += 1
+                future.set_result(None)
+    
+    def on_success(self, latency: float, baseline: Optional[float]):
+        """Adjust the limit after a successful call.
+        
+        Args:
+            latency: Duration of the call
+            baseline: Typical latency of similar calls, None if unknown
+        """
+        if baseline is not None and latency > baseline * Config.LLM_LATENCY_SPIKE_FACTOR:
+            self._decrease(Config.LLM_LATENCY_BACKOFF)
+        elif self.in_flight >= self.capacity:
+            # Only grow when the limit is what holds requests back
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            self._wake()
+    
+    def on_overload(self):
+        """Cut the limit after a rate limit, server error or timeout."""
+        self._decrease(Config.LLM_OVERLOAD_BACKOFF)
+    
+    def _decrease(self, factor: float):
+        # Calls already in flight report the same congestion, so cut at most
+        # once per cooldown
+        now = time.monotonic()
+        if now - self.last_decrease < Config.LLM_CONCURRENCY_DECREASE_COOLDOWN_SECONDS:
+            return
+        self.last_decrease = now
+        self.limit = max(self.min_limit, self.limit * factor)
+        log.info("LLM concurrency limit lowered", extra=fields(limit=round(self.limit, 1)))
+
+
+class LLMTransport:
+    """Resilient calls to the OpenRouter chat completions API.
+    
+    Retryable failures (timeouts, connection errors, 429 and 5xx) are retried
+    with jittered exponential backoff that honours Retry-After. A circuit
+    breaker fails fast while the API is down. Calls slower than the recent
+    p95 can optionally be hedged with a second request. Concurrency is
+    limited by an AdaptiveLimiter.
+    """
+    
+    RETRYABLE_STATUSES = {408, 429, 500, 502, 503, 504}
+    
+    def __init__(self, name: str = "chat", limiter: AdaptiveLimiter = None):
+        self.name = name  # Label that keeps this transport's metrics apart
+        self.headers = {
+            "Authorization": f"Bearer {LLM_API_KEY}",
+            "Content-Type": "application/json"
+        }
+        self.breaker = CircuitBreaker()
+        self.limiter = limiter if limiter is not None else AdaptiveLimiter()
+        self.complete_latency = LatencyWindow()
+        self.stream_latency = LatencyWindow()  # Time to the first streamed event
+        self.retries = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+    
+    async def complete(self, payload: Dict) -> Dict:
+        """Send a chat completion request.
+        
+        Args:
+            payload: Request body
+        
+        Returns:
+            Decoded JSON response
+        
+        Raises:
+            CircuitOpenError: If the circuit breaker is open
+            aiohttp.ClientError: If the request fails after all retries
+        """
+        await self.limiter.acquire()
+        try:
+            with get_metrics().timer("llm_total_seconds", mode="complete", transport=self.name):
+                return await self._call(self._post, payload, self.complete_latency)
+        finally:
+            self.limiter.release()
+    
+    async def stream(self, payload: Dict) -> AsyncIterator[Dict]:
+        """Send a streaming chat completion request.
+        
+        Retries and hedging only apply until the first event arrives; once
+        output has started, errors are raised to the caller.
+        
+        Args:
+            payload: Request body, with ``"stream": True``
+        
+        Yields:
+            Decoded server-sent events
+        
+        Raises:
+            CircuitOpenError: If the circuit breaker is open
+            aiohttp.ClientError: If the request fails after all retries
+        """
+        # The slot is held until the stream ends, since the provider is
+        # still generating until then
+        metrics = get_metrics()
+        await self.limiter.acquire()
+        try:
+            started = time.monotonic()
+            with metrics.timer("llm_ttfb_seconds", mode="stream", transport=self.name):
+                first, events = await self._call(
+                    self._open_stream,
+                    payload,
+                    self.stream_latency,
+                    discard=lambda opened: opened[1].aclose()
+                )
+            try:
+                if first is not None:
+                    yield first
+                async for event in events:
+                    yield event
+            finally:
+                await events.aclose()
+                metrics.observe("llm_total_seconds", time.monotonic() - started, mode="stream", transport=self.name)
+        finally:
+            self.limiter.release()
+    
+    async def _post(self, payload: Dict) -> Dict:
+        timeout = aiohttp.ClientTimeout(
+            total=Config.LLM_TOTAL_TIMEOUT_SECONDS,
+            sock_connect=Config.LLM_CONNECT_TIMEOUT_SECONDS,
+            sock_read=Config.LLM_READ_TIMEOUT_SECONDS
+        )
+        return await get_http_client().post_json(
+            Config.API_URL,
+            headers=self.headers,
+            json=payload,
+            timeout=timeout
+        )
+    
+    async def _open_stream(self, payload: Dict) -> tuple:
+        """Start a stream and wait for its first event."""
+        # The total timeout would cut off long generations, so bound the
+        # gap between chunks instead
+        timeout = aiohttp.ClientTimeout(
+            total=None,
+            sock_connect=Config.LLM_CONNECT_TIMEOUT_SECONDS,
+            sock_read=Config.STREAM_READ_TIMEOUT_SECONDS
+        )
+        events = get_http_client().stream_sse(
+            Config.API_URL,
+            headers=self.headers,
+            json=payload,
+            timeout=timeout
+        )
+        try:
+            first = await events.__anext__()
+        except StopAsyncIteration:
+            first = None
+        except BaseException:
+            await events.aclose()
+            raise
+        return first, events
+    
+    async def _call(
+        self,
+        attempt: Callable[[Dict], Awaitable[Any]],
+        payload: Dict,
+        latency: LatencyWindow,
+        discard: Optional[Callable[[Any], Awaitable[None]]] = None,
+    ) -> Any:
+        """Run an attempt with retries and the circuit breaker."""
+        retry = 0
+        while True:
+            if not self.breaker.allow():
+                get_metrics().inc("llm_rejected_total", transport=self.name)
+                raise CircuitOpenError("LLM API circuit is open after repeated failures")
+            # allow() only sets the flag for the half-open trial call
+            trial = self.breaker.trial_in_flight
+            
+            try:
+                result = await self._hedged(attempt, payload, latency, discard)
+            except asyncio.CancelledError:
+                if trial:
+                    # A cancelled trial proves nothing either way; stay
+                    # half-open so the next call becomes the trial
+                    self.breaker.trial_in_flight = False
+                raise
+            except Exception as e:
+                if not self._is_retryable(e):
+                    # The API answered; a bad request says nothing about its health
+                    self.breaker.record_success()
+                    raise
+                self.breaker.record_failure()
+                self.limiter.on_overload()
+                
+                delay = self._retry_delay(e, retry)
+                if retry >= Config.LLM_MAX_RETRIES or delay is None:
+                    raise
+                retry += 1
+                self.retries += 1
+                get_metrics().inc("llm_retries_total", transport=self.name)
+                log.warning("LLM request failed (%r), retry %d in %.1fs", e, retry, delay)
+                await asyncio.sleep(delay)
+            else:
+                self.breaker.record_success()
+                return result
+    
+    async def _hedged(
+        self,
+        attempt: Callable[[Dict], Awaitable[Any]],
+        payload: Dict,
+        latency: LatencyWindow,
+        discard: Optional[Callable[[Any], Awaitable[None]]],
+    ) -> Any:
+        """Run an attempt, starting a backup request if it is slower than p95."""
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        threshold = latency.percentile(95) if Config.LLM_HEDGE_ENABLED else None
+        
+        primary = asyncio.ensure_future(attempt(payload))
+        tasks = [primary]
+        try:
+            if threshold is not None:
+                await asyncio.wait(tasks, timeout=threshold)
+                if not primary.done():
+                    hedge_payload = payload
+                    if Config.LLM_FALLBACK_MODEL:
+                        hedge_payload = dict(payload, model=Config.LLM_FALLBACK_MODEL)
+                    tasks.append(asyncio.ensure_future(attempt(hedge_payload)))
+                    self.hedges += 1
+            
+            pending = set(tasks)
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                winners = [task for task in done if task.exception() is None]
+                if not winners:
+                    error = next(iter(done)).exception()
+                    continue
+                
+                winner = winners[0]
+                if winner is not primary:
+                    self.hedge_wins += 1
+                if discard is not None:
+                    for task in winners[1:]:
+                        await discard(task.result())
+                elapsed = loop.time() - started
+                self.limiter.on_success(elapsed, latency.percentile(50))
+                latency.record(elapsed)
+                return winner.result()
+            
+            raise error
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+    
+    def _is_retryable(self, error: Exception) -> bool:
+        if isinstance(error, aiohttp.ClientResponseError):
+            return error.status in self.RETRYABLE_STATUSES
+        return isinstance(error, (aiohttp.ClientConnectionError, aiohttp.ClientPayloadError, asyncio.TimeoutError))
+    
+    @staticmethod
+    def _retry_delay(error: Exception, retry: int) -> Optional[float]:
+        """Get how long to wait before a retry, or None if waiting is pointless.
+        
+        Uses full-jitter exponential backoff, but never less than the
+        server's Retry-After.
+        """
+        delay = random.uniform(0, min(
+            Config.LLM_RETRY_MAX_DELAY_SECONDS,
+            Config.LLM_RETRY_BASE_DELAY_SECONDS * 2 ** retry
+        ))
+        
+        headers = getattr(error, "headers", None)
+        retry_after = headers.get("Retry-After") if headers else None
+        if retry_after:
+            try:
+                wait = float(retry_after)
+            except ValueError:
+                try:
+                    wait = parsedate_to_datetime(retry_after).timestamp() - time.time()
+                except (TypeError, ValueError):
+                    wait = 0
+            if wait > Config.LLM_RETRY_MAX_DELAY_SECONDS:
+                return None
+            delay = max(delay, wait)
+        
+        return delay
+    
+    def stats(self) -> Dict[str, Any]:
+        """Get retry, hedging and circuit breaker counters."""
+        return {
+            "retries": self.retries,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "breaker_state": self.breaker.state,
+            "concurrency_limit": round(self.limiter.limit, 2),
+            "in_flight": self.limiter.in_flight,
+        }
+
+
+# Singleton instance
+_transport_instance = None
+
+
+def get_llm_transport() -> LLMTransport:
+    """Get or create the LLM transport singleton instance."""
+    global _transport_instance
+    if _transport_instance is None:
+        _transport_instance = LLMTransport()
+    return _transport_instance
+
+
+_summary_transport_instance = None
+
+
+def get_summary_transport() -> LLMTransport:
+    """Get or create the transport for background history summaries.
+    
+    It has its own breaker, latency windows and a small fixed limiter, so
+    summaries never trip the chat breaker, skew its baselines or take the
+    slots that request scheduling counts on for replies.
+    """
+    global _summary_transport_instance
+    if _summary_transport_instance is None:
+        limiter = AdaptiveLimiter(
+            initial=Config.SUMMARY_MAX_CONCURRENT,
+            min_limit=1,
+            max_limit=Config.SUMMARY_MAX_CONCURRENT
+        )
+        _summary_transport_instance = LLMTransport("summary", limiter)
+    return _summary_transport_instance
@@ -0,0 +1,101 @@
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+from typing import Any, Dict
+from src.config import Config
+
+ROOT_LOGGER = "ieka"
+
+
+def get_logger(category: str) -> logging.Logger:
+    """Get the logger for a category, e.g. "bot" or "payload"."""
+    return logging.getLogger(f"{ROOT_LOGGER}.{category}")
+
+
+def fields(**values: Any) -> Dict[str, Dict[str, Any]]:
+    """Attach structured fields to a log call: ``log.info("...", extra=fields(a=1))``."""
+    return {"fields": values}
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps only a sample of low-level records in noisy categories.
+
+    Warnings and errors are always kept.
+    """
+
+    def __init__(self, rates: Dict[str, float]):
+        super().__init__()
+        self.rates = rates  # logger name -> fraction of records kept
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self.rates.get(record.name)
+        return rate is None or random.random() < rate
+
+
+class LazyQueueHandler(logging.handlers.QueueHandler):
+    """Queue handler that leaves formatting to the listener thread.
+
+    The standard QueueHandler formats each record before queueing it, which
+    would do the expensive part of logging on the event loop.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+class StructuredFormatter(logging.Formatter):
+    """Formats records as text or JSON lines, including structured fields."""
+
+    def __init__(self, as_json: bool = False):
+        super().__init__()
+        self.as_json = as_json
+
+    def format(self, record: logging.LogRecord) -> str:
+        values = getattr(record, "fields", None) or {}
+        if self.as_json:
+            entry = {
+                "time": self.formatTime(record),
+                "level": record.levelname,
+                "category": record.name,
+                "message": record.getMessage(),
+                **values
+            }
+            if record.exc_info:
+                entry["exception"] = self.formatException(record.exc_info)
+            return json.dumps(entry, default=str)
+
+        line = f"{self.formatTime(record)} {record.levelname:<8} {record.name} {record.getMessage()}"
+        if values:
+            line += " " + " ".join(f"{key}={value}" for key, value in values.items())
+        if record.exc_info:
+            line += "\n" + self.formatException(record.exc_info)
+        return line
+
+
+def setup_logging() -> logging.handlers.QueueListener:
+    """Route all logging through a queue to a background writer thread.
+
+    Returns:
+        The started listener; stop it on shutdown to flush pending records
+    """
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(StructuredFormatter(as_json=Config.LOG_FORMAT == "json"))
+
+    records = queue.SimpleQueue()
+    handler = LazyQueueHandler(records)
+    handler.addFilter(SamplingFilter(Config.LOG_SAMPLE_RATES))
+
+    root = logging.getLogger()
+    root.handlers = [handler]
+    root.setLevel(Config.LOG_LEVEL)
+    for name, level in Config.LOG_LEVELS.items():
+        logging.getLogger(name).setLevel(level)
+
+    listener = logging.handlers.QueueListener(records, output, respect_handler_level=True)
+    listener.start()
+    return listener
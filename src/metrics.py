@@ -0,0 +1,235 @@
+import asyncio
+import bisect
+import contextvars
+import os
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, Optional, Tuple
+from aiohttp import web
+from src.config import Config
+from src.log import fields, get_logger
+
+log = get_logger("metrics")
+
+# Histogram buckets in seconds, from cache lookups to slow LLM calls
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+_current_trace = contextvars.ContextVar("trace", default=None)
+
+
+def _label_text(labels: Tuple[Tuple[str, str], ...], extra: str = "") -> str:
+    parts = [f'{key}="{value}"' for key, value in labels]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Histogram:
+    """Distribution of observed values, per label set."""
+    
+    def __init__(self, name: str, help_text: str, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self.series: Dict[tuple, list] = {}  # labels -> [bucket counts..., overflow, sum, count]
+    
+    def observe(self, value: float, labels: tuple = ()):
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series[labels] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+        series[bisect.bisect_left(self.buckets, value)] += 1
+        series[-2] += value
+        series[-1] += 1
+    
+    def render(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.help_text}"
+        yield f"# TYPE {self.name} histogram"
+        for labels, series in self.series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                le = f'le="{bound}"'
+                yield f"{self.name}_bucket{_label_text(labels, le)} {cumulative}"
+            le = 'le="+Inf"'
+            yield f"{self.name}_bucket{_label_text(labels, le)} {series[-1]}"
+            yield f"{self.name}_sum{_label_text(labels)} {series[-2]}"
+            yield f"{self.name}_count{_label_text(labels)} {series[-1]}"
+
+
+class Counter:
+    """Monotonic count, per label set."""
+    
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help_text = help_text
+        self.series: Dict[tuple, float] = {}
+    
+    def inc(self, amount: float = 1, labels: tuple = ()):
+        self.series[labels] = self.series.get(labels, 0) + amount
+    
+    def render(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.help_text}"
+        yield f"# TYPE {self.name} counter"
+        for labels, value in self.series.items():
+            yield f"{self.name}{_label_text(labels)} {value}"
+
+
+class Trace:
+    """Timeline of the stages of one request."""
+    
+    __slots__ = ("name", "started", "spans")
+    
+    def __init__(self, name: str):
+        self.name = name
+        self.started = time.monotonic()
+        self.spans = []  # (stage, offset, duration) in seconds
+    
+    def __str__(self) -> str:
+        total = time.monotonic() - self.started
+        spans = " ".join(
+            f"{stage}@{offset * 1000:.0f}ms+{duration * 1000:.0f}ms"
+            for stage, offset, duration in self.spans
+        )
+        return f"trace {self.name} total={total * 1000:.0f}ms {spans}"
+
+
+class Metrics:
+    """Registry of the bot's metrics.
+    
+    Histograms and counters are recorded as work happens. Components that
+    already keep their own counters register a stats callback instead,
+    which is read only when the metrics are rendered. Everything can be
+    served as Prometheus text over HTTP and dumped to a file periodically.
+    """
+    
+    def __init__(self):
+        self.histograms: Dict[str, Histogram] = {}
+        self.counters: Dict[str, Counter] = {}
+        self.collectors: Dict[str, Callable[[], Dict]] = {}  # name prefix -> stats callback
+        self.runner = None
+        self.dump_task = None
+    
+    def observe(self, name: str, value: float, help_text: str = "", **labels):
+        """Record a value, usually a duration in seconds, in a histogram."""
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = Histogram(name, help_text or name)
+        histogram.observe(value, tuple(sorted(labels.items())))
+    
+    def inc(self, name: str, amount: float = 1, help_text: str = "", **labels):
+        """Increment a counter."""
+        counter = self.counters.get(name)
+        if counter is None:
+            counter = self.counters[name] = Counter(name, help_text or name)
+        counter.inc(amount, tuple(sorted(labels.items())))
+    
+    def register(self, prefix: str, stats: Callable[[], Dict]):
+        """Expose the numeric values of a component's stats() as gauges."""
+        self.collectors[prefix] = stats
+    
+    @contextmanager
+    def timer(self, name: str, **labels):
+        """Time a block of code into a histogram, and into the current trace."""
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            duration = time.monotonic() - started
+            self.observe(name, duration, **labels)
+            trace = _current_trace.get()
+            if trace is not None:
+                stage = labels.get("stage") or labels.get("tool") or name
+                trace.spans.append((stage, started - trace.started, duration))
+    
+    def start_trace(self, name: str) -> Optional[contextvars.Token]:
+        """Start tracing the current task's request, if tracing is enabled."""
+        if not Config.TRACE_REQUESTS:
+            return None
+        return _current_trace.set(Trace(name))
+    
+    def end_trace(self, token: Optional[contextvars.Token]):
+        """Finish the current trace and print its timeline."""
+        if token is None:
+            return
+        trace = _current_trace.get()
+        _current_trace.reset(token)
+        if trace is not None:
+            log.info("%s", trace)
+    
+    def render(self) -> str:
+        """Render all metrics in the Prometheus text format."""
+        lines = []
+        for histogram in self.histograms.values():
+            lines.extend(histogram.render())
+        for counter in self.counters.values():
+            lines.extend(counter.render())
+        for prefix, stats in self.collectors.items():
+            for key, value in self._flatten(prefix, stats()):
+                lines.append(f"# TYPE {key} gauge")
+                lines.append(f"{key} {value}")
+        return "\n".join(lines) + "\n"
+    
+    def _flatten(self, prefix: str, stats: Dict) -> Iterator[Tuple[str, float]]:
+        for key, value in stats.items():
+            name = f"{prefix}_{key}"
+            if isinstance(value, dict):
+                yield from self._flatten(name, value)
+            elif isinstance(value, (int, float)) and not isinstance(value, bool):
+                yield name, value
+    
+    async def start(self):
+        """Start the HTTP endpoint and periodic dump, if configured."""
+        if Config.METRICS_PORT:
+            app = web.Application()
+            app.router.add_get("/metrics", self._handle_metrics)
+            self.runner = web.AppRunner(app)
+            await self.runner.setup()
+            await web.TCPSite(self.runner, Config.METRICS_HOST, Config.METRICS_PORT).start()
+            log.info("Metrics served", extra=fields(url=f"http://{Config.METRICS_HOST}:{Config.METRICS_PORT}/metrics"))
+        if Config.METRICS_DUMP_INTERVAL_SECONDS and self.dump_task is None:
+            self.dump_task = asyncio.create_task(self._dump_loop())
+    
+    async def _handle_metrics(self, request: web.Request) -> web.Response:
+        return web.Response(text=self.render(), content_type="text/plain")
+    
+    async def _dump_loop(self):
+        """Write the metrics to a file, replacing it atomically."""
+        while True:
+            await asyncio.sleep(Config.METRICS_DUMP_INTERVAL_SECONDS)
+            self._dump()
+    
+    def _dump(self):
+        try:
+            os.makedirs(os.path.dirname(Config.METRICS_DUMP_PATH) or ".", exist_ok=True)
+            tmp_path = f"{Config.METRICS_DUMP_PATH}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(self.render())
+            os.replace(tmp_path, Config.METRICS_DUMP_PATH)
+        except OSError as e:
+            log.warning("Failed to write metrics: %s", e)
+    
+    async def close(self):
+        """Stop the endpoint and dump loop, writing a final dump."""
+        if self.dump_task is not None:
+            self.dump_task.cancel()
+            try:
+                await self.dump_task
+            except asyncio.CancelledError:
+                pass
+            self.dump_task = None
+            self._dump()
+        if self.runner is not None:
+            await self.runner.cleanup()
+            self.runner = None
+
+
+# Singleton instance
+_metrics_instance = None
+
+
+def get_metrics() -> Metrics:
+    """Get or create the metrics singleton instance."""
+    global _metrics_instance
+    if _metrics_instance is None:
+        _metrics_instance = Metrics()
+    return _metrics_instance
@@ -0,0 +1,280 @@
+import asyncio
+import re
+import time
+from collections import deque
+from typing import Dict, Hashable, List, Optional, Tuple
+import discord
+from src.config import Config
+from src.metrics import get_metrics
+
+# Opening or closing code fence, with the language of an opening fence
+_FENCE_RE = re.compile(r"```([\w+#.-]*)")
+_CLOSE_FENCE = "\n```"
+
+# Places to split long text, most natural first
+_SPLIT_SEPARATORS = ("\n\n", "\n", ". ", " ")
+
+
+def _open_fence(text: str, fence: Optional[str] = None) -> Optional[str]:
+    """Get the language of the code fence still open at the end of some text.
+    
+    Args:
+        text: Text to scan
+        fence: Language of the fence open at the start of the text, if any
+    
+    Returns:
+        The open fence's language ("" if it has none), or None if no fence is open
+    """
+    for match in _FENCE_RE.finditer(text):
+        fence = match.group(1) if fence is None else None
+    return fence
+
+
+def _split_point(text: str, limit: int) -> int:
+    """Find where to cut text so the first part fits within the limit."""
+    window = text[:limit]
+    for separator in _SPLIT_SEPARATORS:
+        index = window.rfind(separator)
+        # Splitting very early would leave a tiny message behind
+        if index > limit // 2:
+            return index + len(separator)
+    return limit
+
+
+def next_chunk(
+    text: str,
+    fence: Optional[str] = None,
+    max_len: int = Config.DISCORD_MESSAGE_MAX_LENGTH,
+) -> Tuple[str, int, Optional[str]]:
+    """Take the next message-sized chunk of text.
+    
+    Long text is cut at paragraph, line, sentence or word boundaries. A code
+    block cut in two is closed at the end of the chunk and reopened, with its
+    language, at the start of the next one.
+    
+    Args:
+        text: Remaining text
+        fence: Language of a code fence left open by the previous chunk
+        max_len: Maximum message length
+    
+    Returns:
+        Tuple of (message content, characters of text consumed, fence left open)
+    """
+    reopen = f"```{fence}\n" if fence is not None else ""
+    if len(reopen) + len(text) <= max_len:
+        return reopen + text, len(text), _open_fence(text, fence)
+    
+    end = _split_point(text, max_len - len(reopen) - len(_CLOSE_FENCE))
+    part = text[:end]
+    fence = _open_fence(part, fence)
+    content = reopen + part
+    if fence is not None:
+        content = content.rstrip("\n") + _CLOSE_FENCE
+    return content, end, fence
+
+
+def split_message(text: str, max_len: int = Config.DISCORD_MESSAGE_MAX_LENGTH) -> List[str]:
+    """Split text into Discord-sized messages on natural boundaries.
+    
+    Args:
+        text: Text to split
+        max_len: Maximum message length
+    
+    Returns:
+        Non-empty message contents, in order
+    """
+    chunks = []
+    fence = None
+    while text:
+        content, consumed, fence = next_chunk(text, fence, max_len)
+        text = text[consumed:]
+        if content.strip():
+            chunks.append(content)
+    return chunks
+
+
+class SendBucket:
+    """Token bucket allowing ``limit`` sends per ``period`` seconds."""
+    
+    __slots__ = ("limit", "period", "tokens", "updated")
+    
+    def __init__(self, limit: int, period: float):
+        self.limit = limit
+        self.period = period
+        self.tokens = float(limit)
+        self.updated = time.monotonic()
+    
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.limit, self.tokens + (now - self.updated) * self.limit / self.period)
+        self.updated = now
+    
+    def reserve(self) -> float:
+        """Take a send slot.
+        
+        Returns:
+            0 if a slot was taken, otherwise seconds until one is available
+        """
+        self._refill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) * self.period / self.limit
+    
+    @property
+    def idle(self) -> bool:
+        """Whether the bucket has refilled completely."""
+        self._refill()
+        return self.tokens >= self.limit
+    
+    async def acquire(self):
+        """Wait for a send slot."""
+        delay = self.reserve()
+        while delay:
+            await asyncio.sleep(delay)
+            delay = self.reserve()
+
+
+class OutboundOp:
+    """A queued reply or edit."""
+    
+    __slots__ = ("target", "content", "is_edit", "future")
+    
+    def __init__(self, target: discord.Message, content: str, is_edit: bool):
+        self.target = target  # Message to reply to, or to edit
+        self.content = content
+        self.is_edit = is_edit
+        self.future = asyncio.get_running_loop().create_future()
+
+
+class OutboundSender:
+    """Sends bot messages within Discord's rate limits.
+    
+    Sends are queued per channel and paced by a per-channel and a global
+    bucket, so bursts wait here instead of hitting 429s. Queued edits of the
+    same message are coalesced into one that carries the latest content.
+    """
+    
+    def __init__(
+        self,
+        channel_limit: int = Config.DISCORD_CHANNEL_SEND_LIMIT,
+        channel_period: float = Config.DISCORD_CHANNEL_SEND_PERIOD_SECONDS,
+        global_limit: int = Config.DISCORD_GLOBAL_SEND_LIMIT,
+    ):
+        self.channel_limit = channel_limit
+        self.channel_period = channel_period
+        self.global_bucket = SendBucket(global_limit, 1.0)
+        self.queues: Dict[Hashable, deque] = {}  # channel_id -> deque of OutboundOp
+        self.workers: Dict[Hashable, asyncio.Task] = {}  # channel_id -> worker task
+        self.buckets: Dict[Hashable, SendBucket] = {}  # channel_id -> send bucket
+        self.pending_edits: Dict[int, OutboundOp] = {}  # message id -> queued edit
+    
+    def _enqueue(self, channel_id: Hashable, op: OutboundOp) -> asyncio.Future:
+        queue = self.queues.get(channel_id)
+        if queue is None:
+            queue = self.queues[channel_id] = deque()
+        queue.append(op)
+        if channel_id not in self.workers:
+            self.workers[channel_id] = asyncio.create_task(self._channel_worker(channel_id))
+        return op.future
+    
+    async def reply(self, message: discord.Message, text: str) -> List[discord.Message]:
+        """Reply to a message, splitting long text over several replies.
+        
+        Args:
+            message: Message to reply to
+            text: Reply text
+        
+        Returns:
+            The sent replies
+        
+        Raises:
+            discord.HTTPException: If sending fails
+        """
+        # Queue every chunk before waiting so they stay together
+        futures = [
+            self._enqueue(message.channel.id, OutboundOp(message, chunk, is_edit=False))
+            for chunk in split_message(text)
+        ]
+        return list(await asyncio.gather(*futures))
+    
+    def edit(self, target: discord.Message, content: str) -> asyncio.Future:
+        """Queue an edit of a sent message.
+        
+        If an edit of the same message is still queued, its content is
+        replaced instead of queueing another.
+        
+        Args:
+            target: Message to edit
+            content: New content, at most one message long
+        
+        Returns:
+            Future resolved with the edited message
+        """
+        op = self.pending_edits.get(target.id)
+        if op is not None:
+            op.content = content
+            return op.future
+        
+        op = OutboundOp(target, content, is_edit=True)
+        self.pending_edits[target.id] = op
+        return self._enqueue(target.channel.id, op)
+    
+    def _bucket(self, channel_id: Hashable) -> SendBucket:
+        bucket = self.buckets.get(channel_id)
+        if bucket is None:
+            if len(self.buckets) >= Config.DISCORD_SENDER_MAX_BUCKETS:
+                # Buckets that have refilled carry no state worth keeping
+                for idle_id in [key for key, value in self.buckets.items() if value.idle]:
+                    del self.buckets[idle_id]
+            bucket = self.buckets[channel_id] = SendBucket(self.channel_limit, self.channel_period)
+        return bucket
+    
+    async def _channel_worker(self, channel_id: Hashable):
+        """Send a channel's queued messages in order, then exit."""
+        queue = self.queues[channel_id]
+        bucket = self._bucket(channel_id)
+        try:
+            while queue:
+                await bucket.acquire()
+                await self.global_bucket.acquire()
+                
+                op = queue.popleft()
+                if op.is_edit:
+                    # Later edits must queue a new op rather than change this one mid-send
+                    self.pending_edits.pop(op.target.id, None)
+                try:
+                    with get_metrics().timer("discord_send_seconds", op="edit" if op.is_edit else "reply"):
+                        if op.is_edit:
+                            result = await op.target.edit(content=op.content)
+                        else:
+                            result = await op.target.reply(op.content)
+                except asyncio.CancelledError:
+                    op.future.cancel()
+                    raise
+                except Exception as e:
+                    if isinstance(e, discord.HTTPException) and e.status == 429:
+                        get_metrics().inc("discord_rate_limited_total")
+                    if not op.future.done():
+                        op.future.set_exception(e)
+                else:
+                    if not op.future.done():
+                        op.future.set_result(result)
+        finally:
+            del self.workers[channel_id]
+            if not queue:
+                del self.queues[channel_id]
+            if bucket.idle:
+                self.buckets.pop(channel_id, None)
+    
+    async def close(self):
+        """Cancel all channel workers and drop queued sends."""
+        workers = list(self.workers.values())
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        for queue in self.queues.values():
+            for op in queue:
+                op.future.cancel()
+        self.queues.clear()
+        self.pending_edits.clear()
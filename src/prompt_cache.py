@@ -0,0 +1,106 @@
+import os
+import time
+from typing import Dict, Optional
+from src.config import Config
+from src.log import get_logger
+
+log = get_logger("context")
+
+
+class ContextFile:
+    """Static prompt context loaded from disk once.
+    
+    With hot reload enabled, the file's mtime is checked at most once per
+    check interval and the text is reloaded only when it has changed.
+    """
+    
+    def __init__(
+        self,
+        filepath: str,
+        hot_reload: bool = Config.CONTEXT_HOT_RELOAD,
+        check_interval: float = Config.CONTEXT_RELOAD_CHECK_SECONDS,
+    ):
+        self.filepath = filepath
+        self.hot_reload = hot_reload
+        self.check_interval = check_interval
+        self.mtime = None
+        self.last_check = 0.0
+        self._text = ""
+        self._load()
+    
+    @property
+    def text(self) -> str:
+        """Get the context text, reloading it first if the file changed."""
+        if self.hot_reload:
+            now = time.monotonic()
+            if now - self.last_check >= self.check_interval:
+                self.last_check = now
+                if self._current_mtime() != self.mtime:
+                    self._load()
+        return self._text
+    
+    def _current_mtime(self) -> Optional[float]:
+        try:
+            return os.stat(self.filepath).st_mtime
+        except OSError:
+            return None
+    
+    def _load(self):
+        """Load context from file."""
+        self.mtime = self._current_mtime()
+        try:
+            with open(self.filepath, "r", encoding="utf-8") as f:
+                self._text = f.read()
+        except FileNotFoundError:
+            log.warning("%s not found. Using empty system context.", self.filepath)
+            self._text = ""
+
+
+def system_message(text: str) -> Dict:
+    """Build a system message for a static prompt prefix.
+    
+    When enabled, the text is marked as a cache breakpoint so providers that
+    support prompt caching through OpenRouter can reuse the prefix.
+    """
+    if not Config.PROMPT_CACHE_CONTROL:
+        return {"role": "system", "content": text}
+    return {
+        "role": "system",
+        "content": [{
+            "type": "text",
+            "text": text,
+            "cache_control": {"type": "ephemeral"}
+        }]
+    }
+
+
+class PromptCacheStats:
+    """Counts how often the provider served the prompt prefix from its cache."""
+    
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.cached_tokens = 0
+        self.prompt_tokens = 0
+    
+    def record(self, usage: Optional[Dict]):
+        """Record the usage block of a completion response."""
+        if not usage:
+            return
+        details = usage.get("prompt_tokens_details") or {}
+        cached = details.get("cached_tokens") or 0
+        self.prompt_tokens += usage.get("prompt_tokens") or 0
+        self.cached_tokens += cached
+        if cached:
+            self.hits += 1
+        else:
+            self.misses += 1
+    
+    def stats(self) -> Dict[str, int]:
+        """Get cache counters."""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "cached_tokens": self.cached_tokens,
+            "prompt_tokens": self.prompt_tokens,
+        }
@@ -0,0 +1,321 @@
+import asyncio
+import time
+from collections import OrderedDict, deque
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional
+from src.config import Config
+from src.metrics import get_metrics
+from src.log import get_logger
+
+log = get_logger("scheduler")
+
+# Priority classes, highest first. Control commands never queue.
+PRIORITIES = ("chat", "agent")
+
+MIN_GUILD_WEIGHT = 0.1  # Lowest usable guild weight, one request per ten turns
+
+
+class Waiter:
+    """A request waiting for a concurrency slot."""
+    
+    __slots__ = ("future", "guild_key", "user_key", "queued_at")
+    
+    def __init__(self, guild_key: Hashable, user_key: Hashable):
+        self.future = asyncio.get_running_loop().create_future()
+        self.guild_key = guild_key
+        self.user_key = user_key
+        self.queued_at = time.monotonic()
+
+
+class GuildFlow:
+    """Waiters from one guild, served round robin across its users."""
+    
+    __slots__ = ("weight", "deficit", "users")
+    
+    def __init__(self, weight: float):
+        self.weight = weight
+        self.deficit = 0.0
+        self.users = OrderedDict()  # user_key -> deque of Waiter, next user to serve first
+    
+    def push(self, waiter: Waiter):
+        self.users.setdefault(waiter.user_key, deque()).append(waiter)
+    
+    def pop(self) -> Waiter:
+        user_key, waiters = self.users.popitem(last=False)
+        waiter = waiters.popleft()
+        if waiters:
+            # The user goes to the back of the line
+            self.users[user_key] = waiters
+        return waiter
+    
+    def remove(self, waiter: Waiter) -> bool:
+        """Remove a waiter, returning whether it was queued here."""
+        waiters = self.users.get(waiter.user_key)
+        if waiters is None:
+            return False
+        try:
+            waiters.remove(waiter)
+        except ValueError:
+            return False
+        if not waiters:
+            del self.users[waiter.user_key]
+        return True
+
+
+class ClassQueue:
+    """Waiters in one priority class, shared fairly between guilds.
+    
+    Guilds are served by deficit round robin, so a guild with weight 2 gets
+    twice the turns of a guild with weight 1 while both have requests
+    waiting. Within a guild, users take turns.
+    """
+    
+    def __init__(self):
+        self.flows: Dict[Hashable, GuildFlow] = {}  # guild_key -> flow with waiters
+        self.ring = deque()  # guild_keys with waiters, next to serve first
+        self.depth = 0
+        self.waits = deque(maxlen=Config.SCHEDULER_WAIT_SAMPLES)  # Recent queue waits in seconds
+    
+    def push(self, waiter: Waiter):
+        flow = self.flows.get(waiter.guild_key)
+        if flow is None:
+            # A weight of zero or less would never earn a turn, so pop() would spin
+            weight = max(Config.GUILD_WEIGHTS.get(waiter.guild_key, 1), MIN_GUILD_WEIGHT)
+            flow = self.flows[waiter.guild_key] = GuildFlow(weight)
+            self.ring.append(waiter.guild_key)
+        flow.push(waiter)
+        self.depth += 1
+    
+    def pop(self) -> Optional[Waiter]:
+        """Take the next waiter to serve, or None if the class is empty."""
+        while self.ring:
+            guild_key = self.ring[0]
+            flow = self.flows[guild_key]
+            if flow.deficit < 1:
+                # Start of the guild's turn
+                flow.deficit += flow.weight
+                if flow.deficit < 1:
+                    self.ring.rotate(-1)
+                    continue
+            
+            flow.deficit -= 1
+            waiter = flow.pop()
+            self.depth -= 1
+            if not flow.users:
+                self.ring.popleft()
+                del self.flows[guild_key]
+            elif flow.deficit < 1:
+                self.ring.rotate(-1)
+            return waiter
+        return None
+    
+    def remove(self, waiter: Waiter):
+        """Remove a waiter that gave up."""
+        flow = self.flows.get(waiter.guild_key)
+        if flow is None or not flow.remove(waiter):
+            return
+        self.depth -= 1
+        if not flow.users:
+            del self.flows[waiter.guild_key]
+            self.ring.remove(waiter.guild_key)
+    
+    def stats(self) -> Dict[str, float]:
+        """Get queue depth and recent wait times."""
+        waits = sorted(self.waits)
+        return {
+            "depth": self.depth,
+            "avg_wait": sum(waits) / len(waits) if waits else 0.0,
+            "p95_wait": waits[min(len(waits) - 1, int(len(waits) * 0.95))] if waits else 0.0,
+            "max_wait": waits[-1] if waits else 0.0,
+        }
+
+
+class FairLimiter:
+    """Limits concurrent requests, granting slots fairly.
+    
+    Free slots go to the highest priority class with requests waiting, and
+    within a class fairly between guilds and users. The number of slots is
+    fixed, or read from ``capacity`` so it can follow an adaptive limit.
+    """
+    
+    def __init__(
+        self,
+        max_concurrent: int = Config.MAX_CONCURRENT_REQUESTS,
+        capacity: Optional[Callable[[], int]] = None,
+    ):
+        self.capacity = capacity or (lambda: max_concurrent)
+        self.in_use = 0
+        self.queues = {priority: ClassQueue() for priority in PRIORITIES}
+    
+    async def acquire(self, priority: str, guild_id: Hashable, user_id: Hashable):
+        """Wait for a concurrency slot.
+        
+        Args:
+            priority: Priority class, one of PRIORITIES
+            guild_id: Guild the request comes from, None for direct messages
+            user_id: User who made the request
+        """
+        queue = self.queues[priority]
+        if self.in_use < self.capacity() and not any(q.depth for q in self.queues.values()):
+            self.in_use += 1
+            queue.waits.append(0.0)
+            return
+        
+        waiter = Waiter(guild_id, user_id)
+        queue.push(waiter)
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter.future.cancelled():
+                queue.remove(waiter)
+            else:
+                # Granted a slot just as we were cancelled
+                self.release()
+            raise
+    
+    def release(self):
+        """Return a slot, handing free slots to the next waiters."""
+        self.in_use -= 1
+        while self.in_use < self.capacity():
+            for queue in self.queues.values():
+                waiter = queue.pop()
+                if waiter is not None:
+                    break
+            else:
+                return
+            if waiter.future.done():
+                continue  # Cancelled, but not yet removed by its acquire()
+            self.in_use += 1
+            queue.waits.append(time.monotonic() - waiter.queued_at)
+            waiter.future.set_result(None)
+    
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """Get queue depth and wait times per priority class."""
+        return {priority: queue.stats() for priority, queue in self.queues.items()}
+
+
+class PendingBatch:
+    """Messages from one channel waiting to be answered together."""
+    
+    __slots__ = ("items", "guild_id", "user_id", "first_at", "last_at")
+    
+    def __init__(self, guild_id: Hashable, user_id: Hashable):
+        self.items = []
+        self.guild_id = guild_id
+        self.user_id = user_id  # User who started the burst
+        self.first_at = self.last_at = time.monotonic()
+    
+    def add(self, item: Any, max_items: int) -> bool:
+        """Add a message, dropping the oldest beyond max_items.
+        
+        Returns:
+            True if a message was dropped
+        """
+        self.items.append(item)
+        self.last_at = time.monotonic()
+        if len(self.items) > max_items:
+            del self.items[0]
+            return True
+        return False
+    
+    def ready_in(self, window: float, max_wait: float) -> float:
+        """Get seconds until the batch should run, 0 if it is ready."""
+        deadline = min(self.last_at + window, self.first_at + max_wait)
+        return max(0.0, deadline - time.monotonic())
+
+
+class RequestScheduler:
+    """Schedules requests per channel, coalescing bursts.
+    
+    Messages arriving in a channel within the coalesce window of each other
+    are collected into one batch and handled by a single call. A batch keeps
+    only its newest max_items messages, so a flood cannot grow it while it
+    waits for a slot. Batches within a channel run one at a time, while
+    different channels share a global concurrency limit through a FairLimiter.
+    """
+    
+    def __init__(
+        self,
+        handler: Callable[[List[Any]], Awaitable[None]],
+        classify: Callable[[List[Any]], str] = lambda items: "chat",
+        max_concurrent: int = Config.MAX_CONCURRENT_REQUESTS,
+        capacity: Optional[Callable[[], int]] = None,
+        window: float = Config.COALESCE_WINDOW_SECONDS,
+        max_wait: float = Config.COALESCE_MAX_WAIT_SECONDS,
+        max_items: int = Config.COALESCE_MAX_ITEMS,
+    ):
+        self.handler = handler
+        self.classify = classify
+        self.window = window
+        self.max_wait = max_wait
+        self.max_items = max_items
+        self.limiter = FairLimiter(max_concurrent, capacity)
+        self.pending: Dict[Hashable, PendingBatch] = {}  # channel_id -> batch not yet started
+        self.workers: Dict[Hashable, asyncio.Task] = {}  # channel_id -> worker task
+    
+    def submit(self, channel_id: Hashable, item: Any, guild_id: Hashable = None, user_id: Hashable = None):
+        """Add a message to the channel's pending batch.
+        
+        Args:
+            channel_id: Channel the message belongs to
+            item: Value passed to the handler as part of the batch
+            guild_id: Guild the channel belongs to, None for direct messages
+            user_id: User who sent the message
+        """
+        batch = self.pending.get(channel_id)
+        if batch is None:
+            batch = self.pending[channel_id] = PendingBatch(guild_id, user_id)
+        if batch.add(item, self.max_items):
+            get_metrics().inc("coalesce_dropped_total")
+        
+        if channel_id not in self.workers:
+            self.workers[channel_id] = asyncio.create_task(self._channel_worker(channel_id))
+    
+    def queue_size(self, channel_id: Hashable) -> int:
+        """Get the number of messages waiting in a channel."""
+        batch = self.pending.get(channel_id)
+        return len(batch.items) if batch else 0
+    
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """Get queue depth and wait times per priority class."""
+        return self.limiter.stats()
+    
+    async def _channel_worker(self, channel_id: Hashable):
+        """Run a channel's batches as they become ready, then exit."""
+        try:
+            while channel_id in self.pending:
+                # Wait for the burst to go quiet, extending the wait as
+                # messages keep arriving, up to the maximum wait
+                delay = self.pending[channel_id].ready_in(self.window, self.max_wait)
+                while delay:
+                    await asyncio.sleep(delay)
+                    delay = self.pending[channel_id].ready_in(self.window, self.max_wait)
+                
+                batch = self.pending[channel_id]
+                priority = self.classify(batch.items)
+                await self.limiter.acquire(priority, batch.guild_id, batch.user_id)
+                try:
+                    # Messages that arrived while waiting for a slot join this batch
+                    batch = self.pending.pop(channel_id)
+                    get_metrics().observe(
+                        "queue_wait_seconds",
+                        time.monotonic() - batch.first_at,
+                        "Time from a burst's first message to its handling",
+                        priority=priority
+                    )
+                    await self.handler(batch.items)
+                except Exception:
+                    log.exception("Error in request handler")
+                finally:
+                    self.limiter.release()
+        finally:
+            # No await between the empty check and this cleanup, so no
+            # submit() can slip in and be left without a worker.
+            del self.workers[channel_id]
+    
+    async def close(self):
+        """Cancel all channel workers and drop pending batches."""
+        workers = list(self.workers.values())
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        self.pending.clear()
@@ -0,0 +1,88 @@
+import time
+import discord
+from src.config import Config
+from src.outbound_sender import OutboundSender, next_chunk
+
+
+class StreamingReply:
+    """Shows a streamed response as Discord replies that are edited in place.
+
+    The first reply is sent as soon as there is visible text. Further text is
+    applied with rate-limited edits, and a new reply is started whenever the
+    text outgrows the Discord message length limit, split the same way as
+    OutboundSender splits long replies.
+    """
+
+    def __init__(
+        self,
+        message: discord.Message,
+        sender: OutboundSender,
+        edit_interval: float = Config.STREAM_EDIT_INTERVAL_SECONDS,
+        max_len: int = Config.DISCORD_MESSAGE_MAX_LENGTH,
+    ):
+        self.message = message  # Message being replied to
+        self.sender = sender
+        self.edit_interval = edit_interval
+        self.max_len = max_len
+        self.text = ""  # Full response text so far
+        self.reply = None  # Reply currently being edited
+        self.reply_start = 0  # Offset in text where the current reply begins
+        self.fence = None  # Code fence left open by the previous reply
+        self.rendered = ""  # Content last sent for the current reply
+        self.pending_edit = None  # Future of the last queued edit
+        self.last_flush = 0.0
+
+    async def append(self, chunk: str):
+        """Add streamed text, updating Discord if the edit interval has passed.
+
+        Args:
+            chunk: Newly received text
+        """
+        self.text += chunk
+        if self.reply is None or time.monotonic() - self.last_flush >= self.edit_interval:
+            await self._flush()
+
+    async def finish(self) -> str:
+        """Send any pending text.
+
+        Returns:
+            The full response text
+        """
+        await self._flush()
+        if self.pending_edit is not None:
+            await self.pending_edit
+        return self.text
+
+    @property
+    def sent(self) -> bool:
+        """Whether any reply has been sent."""
+        return self.reply is not None or self.reply_start > 0
+
+    async def _flush(self):
+        """Bring the Discord replies up to date with the received text."""
+        while True:
+            content, consumed, fence = next_chunk(self.text[self.reply_start:], self.fence, self.max_len)
+            if not content.strip():
+                # Discord rejects empty messages
+                return
+
+            if self.reply is None:
+                self.reply = (await self.sender.reply(self.message, content))[0]
+            elif content != self.rendered:
+                # Edits are not awaited so the stream keeps flowing; queued
+                # edits are coalesced by the sender
+                if self.pending_edit is not None and self.pending_edit.done():
+                    self.pending_edit.result()  # Raise if the last edit failed
+                self.pending_edit = self.sender.edit(self.reply, content)
+            self.rendered = content
+
+            if self.reply_start + consumed >= len(self.text):
+                break
+
+            # Current reply is full, roll over to a new one
+            self.reply_start += consumed
+            self.fence = fence
+            self.reply = None
+            self.rendered = ""
+
+        self.last_flush = time.monotonic()
@@ -0,0 +1,70 @@
+import re
+from functools import lru_cache
+from typing import Sequence
+from src.config import Config
+
+# Words and individual punctuation marks, roughly how BPE tokenizers split text
+_PIECE_RE = re.compile(r"\w+|[^\w\s]")
+
+# Tokens a chat API spends on each message besides its content (role, separators)
+MESSAGE_TOKEN_OVERHEAD = 4
+
+
+@lru_cache(maxsize=Config.TOKEN_COUNT_CACHE_SIZE)
+def count_tokens(text: str) -> int:
+    """Approximate the number of tokens in a piece of text.
+    
+    Long words are counted as one token per four characters, which is close
+    to what common BPE tokenizers produce for English chat text.
+    """
+    total = 0
+    for match in _PIECE_RE.finditer(text):
+        total += (len(match.group()) + 3) // 4
+    return total
+
+
+def truncate_tokens(text: str, max_tokens: int, marker: str = " [truncated]") -> str:
+    """Cut text down to roughly max_tokens, marking where it was cut."""
+    if count_tokens(text) <= max_tokens:
+        return text
+    budget = max(0, max_tokens - count_tokens(marker))
+    total = 0
+    for match in _PIECE_RE.finditer(text):
+        total += (len(match.group()) + 3) // 4
+        if total > budget:
+            return text[:match.start()].rstrip() + marker
+    return text
+
+
+class ContextBudget:
+    """Fits a prompt into the token budget of a model."""
+    
+    def __init__(self, model: str = Config.MODEL):
+        context_limit = Config.MODEL_CONTEXT_TOKENS.get(model, Config.DEFAULT_CONTEXT_TOKENS)
+        self.max_tokens = min(
+            context_limit - Config.RESPONSE_TOKEN_RESERVE,
+            Config.MAX_PROMPT_TOKENS
+        )
+    
+    def fit(self, history: Sequence, reserved: int = 0) -> Sequence:
+        """Drop the oldest messages until the prompt fits the budget.
+        
+        The newest message is always kept.
+        
+        Args:
+            history: Messages with a ``tokens`` attribute, oldest first
+            reserved: Tokens already used by the rest of the prompt
+        
+        Returns:
+            The newest messages that fit alongside the reserved tokens
+        """
+        available = self.max_tokens - reserved
+        used = 0
+        start = len(history)
+        while start > 0:
+            cost = history[start - 1].tokens + MESSAGE_TOKEN_OVERHEAD
+            if used + cost > available and start < len(history):
+                break
+            used += cost
+            start -= 1
+        return history[start:]